@@ -2,31 +2,53 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, UploadFile, File, Request, Query
 import re
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, OAuth2PasswordBearer
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response, ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.datastructures import MutableHeaders
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, create_model
+from pydantic_core import PydanticUndefined
+from typing import List, Optional, Dict, Any, Tuple, Union, get_args, get_origin
 import uuid
 from datetime import datetime, timezone, timedelta
-import razorpay
 import base64
 import json
 import time 
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
-from pymongo import ASCENDING, DESCENDING
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import math
+import threading
+import asyncio
+import bisect
+from collections import OrderedDict
+import heapq
+import hashlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import orjson
+from contextlib import asynccontextmanager, contextmanager
+import contextvars
+from pymongo import monitoring
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client import multiprocess
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip alone is still negotiated
+    brotli = None
+import itertools
 
 # --- IMPORTS FOR SECURITY ---
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-import httpx
+# jose, passlib, razorpay, cloudinary, numpy and scipy are imported where they
+# are first used, keeping them off the cold-start path (bench/import_budget.py).
 # --- END IMPORTS ---
 
 
@@ -48,12 +70,487 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7 # 7 days
 FRONTEND_URL = os.environ.get('REACT_APP_URL', 'http://localhost:3000')
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated=["auto"])
+@functools.lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated=["auto"])
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 security = HTTPBearer()
 # --- END AUTH CONFIG ---
 
 
+# --- Metrics ---
+# Prometheus metrics served at /metrics. Under gunicorn set PROMETHEUS_MULTIPROC_DIR
+# so every worker writes to a shared directory and a scrape sees all of them.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # if set, /metrics requires "Bearer <token>"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by router, route template, method and status.",
+    ["router", "route", "method", "status"]
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency, including response compression.",
+    ["router", "route", "method"], buckets=LATENCY_BUCKETS
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled.",
+    ["router"], multiprocess_mode="livesum"
+)
+MONGO_OPERATIONS = Counter(
+    "mongodb_operations_total", "MongoDB commands by collection, command and outcome.",
+    ["collection", "command", "outcome"]
+)
+MONGO_OPERATION_SECONDS = Histogram(
+    "mongodb_operation_duration_seconds", "MongoDB command latency as reported by the driver.",
+    ["collection", "command"], buckets=MONGO_LATENCY_BUCKETS
+)
+EXTERNAL_CALL_SECONDS = Histogram(
+    "external_call_duration_seconds", "Latency of Razorpay and Cloudinary SDK calls.",
+    ["service", "operation", "outcome"], buckets=LATENCY_BUCKETS
+)
+
+class MongoMetricsListener(monitoring.CommandListener):
+    """Feeds the mongodb_* metrics. Events arrive on Motor's executor threads."""
+
+    def __init__(self):
+        self._collections: Dict[tuple, str] = {}
+
+    @staticmethod
+    def _key(event) -> tuple:
+        return (event.connection_id, event.request_id)
+
+    def started(self, event):
+        target = event.command.get("collection" if event.command_name == "getMore" else event.command_name)
+        self._collections[self._key(event)] = target if isinstance(target, str) else "-"
+
+    def _finish(self, event, outcome: str):
+        collection = self._collections.pop(self._key(event), "-")
+        MONGO_OPERATIONS.labels(collection, event.command_name, outcome).inc()
+        MONGO_OPERATION_SECONDS.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+mongo_metrics_listener = MongoMetricsListener()
+
+MONGO_POOL_CHECKOUT_SECONDS = Histogram(
+    "mongodb_pool_checkout_wait_seconds", "Time spent waiting to check a connection out of the pool.",
+    ["address"], buckets=MONGO_LATENCY_BUCKETS
+)
+MONGO_POOL_CONNECTIONS = Gauge("mongodb_pool_connections", "Open pool connections.", ["address"])
+MONGO_POOL_CHECKED_OUT = Gauge("mongodb_pool_checked_out", "Pool connections currently in use.", ["address"])
+MONGO_POOL_SATURATION = Gauge("mongodb_pool_saturation", "Checked-out connections / maxPoolSize.", ["address"])
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    "mongodb_pool_checkout_failures_total", "Failed checkouts (timeout, pool closed, connection error).",
+    ["address", "reason"]
+)
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """
+    Tracks checkout wait time and pool saturation per server, for
+    mongodb_pool_* metrics and GET /api/admin/pool-stats. A checkout starts
+    and completes on the same executor thread, which is how the wait is timed.
+    """
+
+    def __init__(self):
+        self.max_pool_size = 100  # replaced with the client's effective option once it exists
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pools: Dict[str, dict] = {}
+
+    def _pool(self, address) -> dict:
+        key = f"{address[0]}:{address[1]}"
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools.setdefault(key, {
+                "address": key, "open": 0, "checked_out": 0, "max_checked_out": 0, "checkouts": 0,
+                "wait_seconds": 0.0, "max_wait_seconds": 0.0, "failures": {}, "cleared": 0
+            })
+        return pool
+
+    def _update_gauges(self, pool: dict):
+        MONGO_POOL_CONNECTIONS.labels(pool["address"]).set(pool["open"])
+        MONGO_POOL_CHECKED_OUT.labels(pool["address"]).set(pool["checked_out"])
+        MONGO_POOL_SATURATION.labels(pool["address"]).set(pool["checked_out"] / self.max_pool_size)
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        waited = time.perf_counter() - getattr(self._local, "started", time.perf_counter())
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["checkouts"] += 1
+            pool["checked_out"] += 1
+            pool["max_checked_out"] = max(pool["max_checked_out"], pool["checked_out"])
+            pool["wait_seconds"] += waited
+            pool["max_wait_seconds"] = max(pool["max_wait_seconds"], waited)
+            self._update_gauges(pool)
+        MONGO_POOL_CHECKOUT_SECONDS.labels(pool["address"]).observe(waited)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["failures"][event.reason] = pool["failures"].get(event.reason, 0) + 1
+        MONGO_POOL_CHECKOUT_FAILURES.labels(pool["address"], event.reason).inc()
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["checked_out"] = max(0, pool["checked_out"] - 1)
+            self._update_gauges(pool)
+
+    def connection_created(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["open"] += 1
+            self._update_gauges(pool)
+
+    def connection_closed(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["open"] = max(0, pool["open"] - 1)
+            self._update_gauges(pool)
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._pool(event.address)["cleared"] += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def stats(self) -> List[dict]:
+        with self._lock:
+            return [
+                {
+                    **{k: v for k, v in pool.items() if k not in ("wait_seconds", "max_wait_seconds")},
+                    "failures": dict(pool["failures"]),
+                    "saturation": round(pool["checked_out"] / self.max_pool_size, 4),
+                    "avg_wait_ms": round(pool["wait_seconds"] * 1000 / pool["checkouts"], 3) if pool["checkouts"] else 0.0,
+                    "max_wait_ms": round(pool["max_wait_seconds"] * 1000, 3)
+                }
+                for pool in self._pools.values()
+            ]
+
+mongo_pool_listener = MongoPoolListener()
+
+@contextmanager
+def track_external(service: str, operation: str):
+    """Times a third-party SDK call into external_call_duration_seconds."""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        EXTERNAL_CALL_SECONDS.labels(service, operation, outcome).observe(time.perf_counter() - started)
+
+class CacheStatsCollector:
+    """Exposes the in-process caches (CACHE_REGISTRY) as hit/miss counters and a hit ratio."""
+
+    @staticmethod
+    def _families():
+        return (
+            CounterMetricFamily("cache_hits", "Cache lookups served from memory.", labels=["cache"]),
+            CounterMetricFamily("cache_misses", "Cache lookups that fell through to MongoDB.", labels=["cache"]),
+            GaugeMetricFamily("cache_hit_ratio", "Hits / lookups since the worker started.", labels=["cache"]),
+        )
+
+    def describe(self):
+        # Lets the registry check metric names without reading CACHE_REGISTRY,
+        # which is only defined further down this module.
+        return self._families()
+
+    def collect(self):
+        hits, misses, ratio = self._families()
+        for name, cache in CACHE_REGISTRY.items():
+            stats = cache.stats()
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            ratio.add_metric([name], stats["hit_ratio"])
+        return hits, misses, ratio
+
+REGISTRY.register(CacheStatsCollector())
+
+# (prefix, router label), longest prefix first; filled in when the routers are included.
+ROUTER_PREFIXES: List[tuple] = []
+
+def router_label(path: str) -> str:
+    for prefix, label in ROUTER_PREFIXES:
+        if path == prefix or path.startswith(prefix + "/"):
+            return label
+    return "app"
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording request counts, status codes, latency and
+    in-flight requests. Routes are labelled by their path template, unmatched
+    paths as "unmatched", so the label set stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        router = router_label(scope["path"])
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.labels(router).inc()
+        scope_token = current_request_scope.set(scope)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request_scope.reset(scope_token)
+            HTTP_IN_FLIGHT.labels(router).dec()
+            route = scope.get("route")
+            template = getattr(route, "path", "unmatched")
+            HTTP_REQUESTS.labels(router, template, scope["method"], str(status_code)).inc()
+            HTTP_REQUEST_SECONDS.labels(router, template, scope["method"]).observe(time.perf_counter() - started)
+
+# --- Slow Query Log ---
+# Every MongoDB operation slower than SLOW_QUERY_MS is logged with its filter
+# shape, collection, duration, documents returned/examined and the route that
+# issued it. A cursor (find/aggregate plus its getMores, e.g. a to_list(10000)
+# scan) is timed as one operation. Shapes are aggregated for
+# GET /api/admin/slow-queries over a rolling window.
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+SLOW_QUERY_WINDOW_SECONDS = int(os.environ.get('SLOW_QUERY_WINDOW_SECONDS', 3600))
+SLOW_QUERY_MAX_SHAPES = 200
+SLOW_QUERY_EXPLAIN_SECONDS = 600  # re-explain a shape at most this often
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+MONITORED_COMMANDS = EXPLAINABLE_COMMANDS | {"insert"}
+MAX_TRACKED_CURSORS = 1000
+# Cursors dropped without a killCursors (e.g. the client went away) are forgotten
+# after this long, matching mongod's default idle cursor timeout.
+TRACKED_CURSOR_TTL_SECONDS = 600
+# Session/transport fields that must not be passed back inside an explain.
+COMMAND_ENVELOPE_FIELDS = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "autocommit", "startTransaction"}
+
+# The ASGI scope of the request being handled. Motor runs pymongo calls on
+# executor threads with a copy of the caller's context, so listeners see it.
+current_request_scope: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("current_request_scope", default=None)
+
+def query_shape(value):
+    """Replaces literal values with "?", keeping field names and operators."""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if any(isinstance(item, dict) for item in value):
+            return [query_shape(item) for item in value]
+        return ["?"]
+    return "?"
+
+def command_filter(command_name: str, command: dict):
+    if command_name == "find":
+        return {key: command[key] for key in ("filter", "sort") if key in command}
+    if command_name == "aggregate":
+        return command.get("pipeline", [])
+    if command_name in ("count", "distinct", "findAndModify"):
+        return command.get("query", {})
+    if command_name in ("update", "delete"):
+        statements = command.get(command_name + "s", [])
+        return statements[0].get("q", {}) if statements else {}
+    return {}
+
+def _iter_key(doc, key):
+    """Yields every value stored under `key` anywhere inside an explain document."""
+    if isinstance(doc, dict):
+        for k, v in doc.items():
+            if k == key:
+                yield v
+            yield from _iter_key(v, key)
+    elif isinstance(doc, list):
+        for item in doc:
+            yield from _iter_key(item, key)
+
+class SlowQueryLog(monitoring.CommandListener):
+    def __init__(self, threshold_ms: float, window_seconds: int, max_shapes: int):
+        self.threshold_ms = threshold_ms
+        self.window_seconds = window_seconds
+        self.max_shapes = max_shapes
+        self.loop: Optional[asyncio.AbstractEventLoop] = None  # set at startup; enables explains
+        self._pending: Dict[tuple, dict] = {}
+        self._cursors: "OrderedDict[int, tuple]" = OrderedDict()  # cursor id -> (tracked_at, operation)
+        self._shapes: "OrderedDict[str, dict]" = OrderedDict()
+        # Listener callbacks run on Motor's executor threads; top() runs on the loop.
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(event) -> tuple:
+        return (event.connection_id, event.request_id)
+
+    def started(self, event):
+        name = event.command_name
+        if name == "getMore":
+            with self._lock:
+                operation = self._cursors.get(event.command["getMore"], (None, None))[1]
+        elif name == "killCursors":
+            # A cursor closed before exhaustion (e.g. to_list hit its length) ends here.
+            for cursor_id in event.command.get("cursors", []):
+                if (operation := self._untrack_cursor(cursor_id)) is not None:
+                    self._finish(operation)
+            return
+        elif name not in MONITORED_COMMANDS:
+            return
+        else:
+            scope = current_request_scope.get()
+            route = None
+            if scope is not None:
+                route = f'{scope["method"]} {getattr(scope.get("route"), "path", scope["path"])}'
+            operation = {
+                "database": event.database_name,
+                "collection": event.command.get(name),
+                "command_name": name,
+                "command": event.command,
+                "route": route,
+                "ms": 0.0,
+                "docs_returned": 0,
+            }
+        if operation is not None:
+            self._pending[self._key(event)] = operation
+
+    def succeeded(self, event):
+        operation = self._pending.pop(self._key(event), None)
+        if operation is None:
+            return
+        operation["ms"] += event.duration_micros / 1000
+        cursor = event.reply.get("cursor")
+        if isinstance(cursor, dict):
+            operation["docs_returned"] += len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+            if cursor.get("id"):
+                self._track_cursor(cursor["id"], operation)
+                return
+            if event.command_name == "getMore":
+                self._untrack_cursor(event.command["getMore"])
+        else:
+            operation["docs_returned"] += event.reply.get("n", 0)
+        self._finish(operation)
+
+    def failed(self, event):
+        operation = self._pending.pop(self._key(event), None)
+        if operation is not None and event.command_name == "getMore":
+            self._untrack_cursor(event.command["getMore"])
+
+    def _track_cursor(self, cursor_id: int, operation: dict):
+        now = time.monotonic()
+        with self._lock:
+            self._cursors.pop(cursor_id, None)
+            self._cursors[cursor_id] = (now, operation)
+            # Oldest first: expire abandoned cursors, and evict rather than stop tracking when full.
+            while self._cursors:
+                tracked_at, _ = next(iter(self._cursors.values()))
+                if now - tracked_at <= TRACKED_CURSOR_TTL_SECONDS and len(self._cursors) <= MAX_TRACKED_CURSORS:
+                    break
+                self._cursors.popitem(last=False)
+
+    def _untrack_cursor(self, cursor_id: int) -> Optional[dict]:
+        with self._lock:
+            return self._cursors.pop(cursor_id, (None, None))[1]
+
+    def _finish(self, operation: dict):
+        if operation["ms"] < self.threshold_ms:
+            return
+        name = operation["command_name"]
+        shape = query_shape(command_filter(name, operation["command"]))
+        shape_key = json.dumps([operation["collection"], name, shape], sort_keys=True, default=str)
+        now = time.time()
+        stats = self._record(shape_key, operation, shape, now)
+
+        # New (or stale) shapes are explained first so the log line carries docs examined.
+        explain_due = now - stats["explained_at"] >= SLOW_QUERY_EXPLAIN_SECONDS
+        if self.loop is not None and name in EXPLAINABLE_COMMANDS and explain_due:
+            stats["explained_at"] = now
+            asyncio.run_coroutine_threadsafe(self._explain(operation, stats), self.loop)
+        else:
+            self._log(operation, stats)
+
+    def _record(self, shape_key: str, operation: dict, shape, now: float) -> dict:
+        with self._lock:
+            return self._record_locked(shape_key, operation, shape, now)
+
+    def _record_locked(self, shape_key: str, operation: dict, shape, now: float) -> dict:
+        stats = self._shapes.pop(shape_key, None)
+        if stats is None or now - stats["last_seen"] > self.window_seconds:
+            stats = {
+                "collection": operation["collection"], "command": operation["command_name"], "shape": shape,
+                "count": 0, "total_ms": 0.0, "max_ms": 0.0, "docs_returned": 0, "routes": {},
+                "docs_examined": None, "keys_examined": None, "plan": None, "explained_at": 0.0
+            }
+        stats["count"] += 1
+        stats["total_ms"] += operation["ms"]
+        stats["max_ms"] = max(stats["max_ms"], operation["ms"])
+        stats["docs_returned"] += operation["docs_returned"]
+        route = operation["route"] or "background"
+        stats["routes"][route] = stats["routes"].get(route, 0) + 1
+        stats["last_seen"] = now
+        self._shapes[shape_key] = stats
+        while len(self._shapes) > self.max_shapes:
+            self._shapes.popitem(last=False)
+        return stats
+
+    async def _explain(self, operation: dict, stats: dict):
+        command = {k: v for k, v in operation["command"].items() if k not in COMMAND_ENVELOPE_FIELDS}
+        try:
+            if any(stage.keys() & {"$out", "$merge"} for stage in command.get("pipeline", [])):
+                raise ValueError("write stages are not explained")
+            explain = await client[operation["database"]].command(
+                {"explain": command, "verbosity": "executionStats"}
+            )
+            stats["docs_examined"] = sum(s.get("totalDocsExamined", 0) for s in _iter_key(explain, "executionStats"))
+            stats["keys_examined"] = sum(s.get("totalKeysExamined", 0) for s in _iter_key(explain, "executionStats"))
+            plan_stages = set(_iter_key(explain.get("queryPlanner", explain), "stage"))
+            stats["plan"] = "COLLSCAN" if "COLLSCAN" in plan_stages else ",".join(sorted(plan_stages)) or None
+        except Exception as e:
+            logger.debug(f"Explain failed for slow {operation['collection']}.{operation['command_name']}: {e}")
+        self._log(operation, stats)
+
+    @staticmethod
+    def _log(operation: dict, stats: dict):
+        logger.warning(
+            "Slow query: %s.%s %.1f ms route=%s docs_returned=%d docs_examined=%s plan=%s shape=%s",
+            operation["collection"], operation["command_name"], operation["ms"], operation["route"] or "background",
+            operation["docs_returned"], stats["docs_examined"], stats["plan"],
+            json.dumps(stats["shape"], default=str)
+        )
+
+    def top(self, limit: int, sort: str) -> List[dict]:
+        cutoff = time.time() - self.window_seconds
+        with self._lock:
+            shapes = [
+                {**{k: v for k, v in stats.items() if k != "explained_at"}, "routes": dict(stats["routes"])}
+                for stats in self._shapes.values() if stats["last_seen"] >= cutoff
+            ]
+        for stats in shapes:
+            stats["avg_ms"] = round(stats["total_ms"] / stats["count"], 1)
+        return heapq.nlargest(limit, shapes, key=lambda stats: stats[sort])
+
+slow_query_log = SlowQueryLog(SLOW_QUERY_MS, SLOW_QUERY_WINDOW_SECONDS, SLOW_QUERY_MAX_SHAPES)
+
 # MongoDB connection
 try:
     mongo_url = os.environ['MONGO_URL']
@@ -61,41 +558,319 @@ except KeyError:
     logger.error("MONGO_URL not found in environment variables.")
     raise Exception("MONGO_URL must be configured.")
     
-client = AsyncIOMotorClient(mongo_url)
+# Pool, timeout and compression settings; unset variables keep the driver defaults
+# (or whatever the connection string specifies). Pools are per process, so with
+# gunicorn the server sees workers x MONGO_MAX_POOL_SIZE connections at most.
+MONGO_CLIENT_ENV_OPTIONS = (
+    ("maxPoolSize", "MONGO_MAX_POOL_SIZE", int),
+    ("minPoolSize", "MONGO_MIN_POOL_SIZE", int),
+    ("maxIdleTimeMS", "MONGO_MAX_IDLE_TIME_MS", int),
+    ("waitQueueTimeoutMS", "MONGO_WAIT_QUEUE_TIMEOUT_MS", int),
+    ("serverSelectionTimeoutMS", "MONGO_SERVER_SELECTION_TIMEOUT_MS", int),
+    ("compressors", "MONGO_COMPRESSORS", str),  # e.g. "zstd,snappy,zlib"; zstd needs zstandard installed
+)
+mongo_client_options = {
+    option: cast(os.environ[env_name])
+    for option, env_name, cast in MONGO_CLIENT_ENV_OPTIONS
+    if os.environ.get(env_name)
+}
+
+client = AsyncIOMotorClient(
+    mongo_url,
+    event_listeners=[mongo_metrics_listener, slow_query_log, mongo_pool_listener],
+    **mongo_client_options
+)
+mongo_pool_listener.max_pool_size = client.options.pool_options.max_pool_size or 100
 ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL') 
 db = client[os.environ.get('DB_NAME', 'default-db-name')] # Use .get for safety
 
-# Razorpay client
-razorpay_client = razorpay.Client(auth=(os.environ.get('RAZORPAY_KEY_ID', 'rzp_test_key'), os.environ.get('RAZORPAY_KEY_SECRET', 'rzp_test_secret')))
-
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name = os.environ.get('CLOUDINARY_CLOUD_NAME'),
-    api_key = os.environ.get('CLOUDINARY_API_KEY'),
-    api_secret = os.environ.get('CLOUDINARY_API_SECRET')
-)
+# Razorpay client. Created on first checkout: the SDK pulls in requests/urllib3.
+razorpay_client = None  # benchmarks may assign a stub before the first request
+
+def get_razorpay_client():
+    global razorpay_client
+    if razorpay_client is None:
+        import razorpay
+        razorpay_client = razorpay.Client(auth=(os.environ.get('RAZORPAY_KEY_ID', 'rzp_test_key'), os.environ.get('RAZORPAY_KEY_SECRET', 'rzp_test_secret')))
+    return razorpay_client
+
+# Configure Cloudinary on first use (only the admin upload signature needs it)
+@functools.lru_cache(maxsize=None)
+def get_cloudinary():
+    import cloudinary
+    import cloudinary.utils
+    cloudinary.config(
+        cloud_name = os.environ.get('CLOUDINARY_CLOUD_NAME'),
+        api_key = os.environ.get('CLOUDINARY_API_KEY'),
+        api_secret = os.environ.get('CLOUDINARY_API_SECRET')
+    )
+    return cloudinary
+
+# --- Index Bootstrap ---
+# Every hot query filters or sorts on non-_id fields. Each entry below maps to
+# the route(s) that need it. Unique constraints are only declared where the
+# code already assumes uniqueness (register/create_coupon check before insert,
+# ids are uuid4). Slugs are derived from names and may collide, so the slug
+# index is deliberately non-unique.
+INDEX_SPECS = [
+    # get_product, update_product, delete_product, inventory updates
+    {"collection": "products", "keys": [("id", ASCENDING)], "unique": True},
+    # get_product by slug, and by slugs retired when a product was renamed
+    {"collection": "products", "keys": [("slug", ASCENDING)]},
+    {"collection": "products", "keys": [("previous_slugs", ASCENDING)]},
+    # get_featured_products, get_product_recommendations
+    {"collection": "products", "keys": [("featured", ASCENDING)]},
+    # get_products sort=price-low / price-high, keyset-paginated on (price, id)
+    {"collection": "products", "keys": [("price", ASCENDING), ("id", ASCENDING)]},
+    # get_products sort=name (default), keyset-paginated on (name, id)
+    {"collection": "products", "keys": [("name", ASCENDING), ("id", ASCENDING)]},
+    # get_products category filter
+    {"collection": "products", "keys": [("category", ASCENDING)]},
+    # verify_payment, request_return, admin order/return actions
+    {"collection": "orders", "keys": [("id", ASCENDING)], "unique": True},
+    # get_my_orders
+    {"collection": "orders", "keys": [("user_id", ASCENDING), ("created_at", DESCENDING)]},
+    # get_all_orders, dashboard recent orders
+    {"collection": "orders", "keys": [("created_at", DESCENDING)]},
+    # dashboard revenue, check_abandoned_carts (status + created_at range)
+    {"collection": "orders", "keys": [("status", ASCENDING), ("created_at", ASCENDING)]},
+    # get_all_return_requests
+    {"collection": "orders", "keys": [("return_status", ASCENDING), ("return_request_date", DESCENDING)]},
+    # get_product_reviews
+    {"collection": "reviews", "keys": [("product_id", ASCENDING)]},
+    # register_user, login_for_access_token
+    {"collection": "users", "keys": [("email", ASCENDING)], "unique": True},
+    # TokenRevocations.refresh (token_version > 0)
+    {"collection": "users", "keys": [("token_version", ASCENDING)]},
+    # apply_coupon_discount, create_coupon
+    {"collection": "coupons", "keys": [("code", ASCENDING)], "unique": True},
+    # delete_coupon
+    {"collection": "coupons", "keys": [("id", ASCENDING)]},
+]
+
+def index_name(keys) -> str:
+    """Mirrors pymongo's default index naming, e.g. user_id_1_created_at_-1."""
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+async def ensure_indexes():
+    """
+    Applies INDEX_SPECS idempotently and logs a report of what was created,
+    what already existed and how long each build took.
+    """
+    report = []
+    existing_by_collection = {}
+    for spec in INDEX_SPECS:
+        collection_name = spec["collection"]
+        name = index_name(spec["keys"])
+        if collection_name not in existing_by_collection:
+            try:
+                existing_by_collection[collection_name] = set(await db[collection_name].index_information())
+            except Exception:
+                existing_by_collection[collection_name] = set()
+
+        if name in existing_by_collection[collection_name]:
+            report.append({"collection": collection_name, "index": name, "status": "exists", "ms": 0.0})
+            continue
 
-# Create the main app
-app = FastAPI()
-api_router = APIRouter(prefix="/api")
+        started = time.perf_counter()
+        try:
+            options = {"expireAfterSeconds": spec["expire_after_seconds"]} if "expire_after_seconds" in spec else {}
+            await db[collection_name].create_index(spec["keys"], name=name, unique=spec.get("unique", False), **options)
+            status = "created"
+        except Exception as e:
+            # A unique build fails if the data already has duplicates; keep the
+            # remaining indexes going and surface it in the report.
+            status = f"failed: {e}"
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        existing_by_collection[collection_name].add(name)
+        report.append({"collection": collection_name, "index": name, "status": status, "ms": round(elapsed_ms, 1)})
+
+    for entry in report:
+        log = logger.error if entry["status"].startswith("failed") else logger.info
+        log(f"Index {entry['collection']}.{entry['index']}: {entry['status']} ({entry['ms']} ms)")
+    created = sum(1 for entry in report if entry["status"] == "created")
+    failed = sum(1 for entry in report if entry["status"].startswith("failed"))
+    logger.info(f"Index bootstrap complete: {created} created, {len(report) - created - failed} existing, {failed} failed.")
+    return report
+
+
+# --- Lifespan ---
+# Warm-up that must finish before the worker accepts traffic. External clients
+# (Razorpay, Cloudinary) are deliberately not created here: they are lazy.
+MONGO_WARM_CONNECTIONS = int(os.environ.get('MONGO_WARM_CONNECTIONS', '0'))  # 0 = max(1, minPoolSize)
+
+async def warm_mongo_pool():
+    """Opens pool connections up front so early requests skip TCP/TLS/auth handshakes."""
+    count = MONGO_WARM_CONNECTIONS or max(1, client.options.pool_options.min_pool_size)
+    started = time.perf_counter()
+    # Concurrent pings each check out their own connection.
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(count)))
+    logger.info(f"Mongo pool warmed: {count} connection(s) in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+async def warm_recommendations():
+    try:
+        await co_purchase_recommender.ensure_built()
+    except Exception as e:
+        logger.error(f"Recommendation warm-up failed: {e}")
 
-# --- Startup Event: Initialize Rate Limiter ---
-@app.on_event("startup")
-async def startup_event():
-    # Rate Limiting initialization is currently skipped to bypass Redis dependency.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    slow_query_log.loop = asyncio.get_running_loop()
     try:
-        # Placeholder for future Redis connection
-        logger.info("Rate Limiting initialization skipped.")
+        await warm_mongo_pool()
     except Exception as e:
-        logger.error(f"Failed to initialize Rate Limiting: {e}")
+        # Unreachable: each index call would also wait out server selection and
+        # could hold startup past the gunicorn worker timeout.
+        logger.error(f"Mongo pool warm-up failed, skipping index bootstrap: {e}")
+    else:
+        try:
+            await ensure_indexes()
+        except Exception as e:
+            logger.error(f"Index bootstrap failed: {e}")
+        try:
+            await token_revocations.refresh()
+        except Exception as e:
+            logger.error(f"Token revocation load failed: {e}")
+
+    logger.info(f"Rate limiting: {RATE_LIMIT_BACKEND + ' backend' if RATE_LIMIT_ENABLED else 'disabled'}")
+
+    # Built after the worker starts serving, so the numpy/scipy import and the
+    # first matrix build don't land on a request or delay readiness.
+    recommendations_task = asyncio.create_task(warm_recommendations())
+    revocations_task = asyncio.create_task(token_revocations.refresh_forever(TOKEN_REVOCATION_REFRESH_SECONDS))
+    yield
+    recommendations_task.cancel()
+    revocations_task.cancel()
+    password_hash_executor.shutdown()
+    client.close()
+
+# Create the main app
+app = FastAPI(lifespan=lifespan)
+api_router = APIRouter(prefix="/api")
 
 # --- Password & JWT Helper Functions ---
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def hash_password(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+# --- Password Hashing Executor ---
+# bcrypt costs ~200 ms of CPU per call. Run inline, a burst of logins stalls every
+# other request on the worker, so hashing runs on a small thread pool (bcrypt
+# releases the GIL) behind a bounded queue. When the queue is full the request
+# gets an immediate 429 instead of waiting behind seconds of queued hashes.
+# Releasing the GIL is not enough when the CPUs are busy: the hashing threads
+# would still take CPU time from the event loop thread, so they run at a lower
+# scheduling priority (Linux applies nice values per thread). A lower priority
+# only shrinks their share; to keep them off the request cores entirely, start
+# the server on some CPUs (e.g. `taskset -c 0-5 python serve.py`) and pin the
+# hashing threads to the others with PASSWORD_HASH_CPUS=6,7.
+PASSWORD_HASH_CONCURRENCY = max(1, int(os.environ.get('PASSWORD_HASH_CONCURRENCY', '1')))
+PASSWORD_HASH_MAX_QUEUE = max(0, int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', '16')))
+PASSWORD_HASH_NICE = int(os.environ.get('PASSWORD_HASH_NICE', '19'))  # 19 is the lowest priority; 0 disables
+PASSWORD_HASH_RETRY_AFTER = os.environ.get('PASSWORD_HASH_RETRY_AFTER', '1')  # seconds, sent with the 429
+PASSWORD_HASH_CPUS = os.environ.get('PASSWORD_HASH_CPUS', '')  # e.g. "6,7" or "6-7"; unset leaves affinity alone
+
+def parse_cpu_list(spec: str) -> set:
+    """CPU numbers from a taskset-style list: "0,2,4-7"."""
+    cpus = set()
+    for part in filter(None, (part.strip() for part in spec.split(","))):
+        low, _, high = part.partition("-")
+        cpus.update(range(int(low), int(high or low) + 1))
+    return cpus
+
+PASSWORD_HASH_QUEUED = Gauge(
+    "password_hash_queue_depth", "Password hash/verify jobs waiting for an executor thread.",
+    multiprocess_mode="livesum"
+)
+PASSWORD_HASH_RUNNING = Gauge(
+    "password_hash_in_progress", "Password hash/verify jobs currently running.",
+    multiprocess_mode="livesum"
+)
+PASSWORD_HASH_REJECTED = Counter(
+    "password_hash_rejected_total", "Password jobs refused with a 429 because the queue was full.",
+    ["operation"]
+)
+PASSWORD_HASH_WAIT_SECONDS = Histogram(
+    "password_hash_queue_wait_seconds", "Time a password job spent queued before running.",
+    ["operation"], buckets=LATENCY_BUCKETS
+)
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_duration_seconds", "Time spent hashing or verifying a password.",
+    ["operation"], buckets=LATENCY_BUCKETS
+)
+
+class PasswordHashExecutor:
+    """Bounded thread pool for bcrypt. `pending` is only touched on the event loop thread."""
+
+    def __init__(self, concurrency: int, max_queue: int):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.pending = 0  # submitted and not yet finished, running or queued
+        self._executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="password-hash", initializer=self._prepare_thread
+        )
+
+    @staticmethod
+    def _prepare_thread():
+        if PASSWORD_HASH_NICE and hasattr(os, "setpriority"):
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), PASSWORD_HASH_NICE)
+            except OSError as e:
+                logger.warning(f"Could not lower password hashing thread priority: {e}")
+        if PASSWORD_HASH_CPUS and hasattr(os, "sched_setaffinity"):
+            try:
+                os.sched_setaffinity(threading.get_native_id(), parse_cpu_list(PASSWORD_HASH_CPUS))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not pin password hashing threads to CPUs {PASSWORD_HASH_CPUS}: {e}")
+
+    def _set_gauges(self):
+        PASSWORD_HASH_RUNNING.set(min(self.pending, self.concurrency))
+        PASSWORD_HASH_QUEUED.set(max(0, self.pending - self.concurrency))
+
+    def _release(self):
+        self.pending -= 1
+        self._set_gauges()
+
+    async def run(self, operation: str, fn, *args):
+        if self.pending >= self.concurrency + self.max_queue:
+            PASSWORD_HASH_REJECTED.labels(operation).inc()
+            raise HTTPException(
+                status_code=429,
+                detail="Too many sign-in attempts right now. Please try again shortly.",
+                headers={"Retry-After": PASSWORD_HASH_RETRY_AFTER},
+            )
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            PASSWORD_HASH_WAIT_SECONDS.labels(operation).observe(started - submitted)
+            try:
+                return fn(*args)
+            finally:
+                PASSWORD_HASH_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+        loop = asyncio.get_running_loop()
+        future = self._executor.submit(timed)
+        self.pending += 1
+        self._set_gauges()
+        # Released when the thread finishes, not when the awaiting request goes
+        # away: a disconnected client's hash still occupies the thread.
+        future.add_done_callback(lambda _: loop.is_closed() or loop.call_soon_threadsafe(self._release))
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+password_hash_executor = PasswordHashExecutor(PASSWORD_HASH_CONCURRENCY, PASSWORD_HASH_MAX_QUEUE)
+
+async def verify_password_async(plain_password, hashed_password):
+    return await password_hash_executor.run("verify", verify_password, plain_password, hashed_password)
+
+async def hash_password_async(password):
+    return await password_hash_executor.run("hash", hash_password, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -104,6 +879,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -124,36 +900,275 @@ def generate_slug(name: str) -> str:
 class TokenData(BaseModel):
     user_id: Optional[str] = None
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
+def token_claims(user: dict) -> dict:
+    """
+    Claims for create_access_token. Role and email let verify_admin authorize
+    without a database read; "ver" is the user's token_version at issue time.
+    """
+    email = user.get("email")
+    return {
+        "sub": user["_id"],
+        "email": email,
+        "role": "admin" if ADMIN_EMAIL and email == ADMIN_EMAIL else "customer",
+        "ver": user.get("token_version", 0),
+    }
+
+class TokenRevocations:
+    """
+    Per-user token revocation. Revoking increments users.token_version, and a
+    token whose "ver" claim is below its user's current version is rejected.
+    Only users who have ever revoked have a version above 0, so the whole set
+    is held in memory and refreshed every TOKEN_REVOCATION_REFRESH_SECONDS
+    instead of being read per request. Revocations made on another worker
+    take effect here at the next refresh.
+    """
+    def __init__(self):
+        self.min_version: Dict[str, int] = {}
+        self.refreshed_at: Optional[float] = None
+
+    async def refresh(self):
+        cursor = db.users.find({"token_version": {"$gt": 0}}, {"token_version": 1})
+        latest = {doc["_id"]: doc["token_version"] async for doc in cursor}
+        # Versions only grow, so keep a local revoke() the query may have raced with.
+        for user_id, version in self.min_version.items():
+            latest[user_id] = max(version, latest.get(user_id, 0))
+        self.min_version = latest
+        self.refreshed_at = time.time()
+
+    async def refresh_forever(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Token revocation refresh failed, keeping the previous set: {e}")
+
+    def revoke(self, user_id: str, version: int):
+        self.min_version[user_id] = max(version, self.min_version.get(user_id, 0))
+
+    def is_revoked(self, payload: dict) -> bool:
+        return payload.get("ver", 0) < self.min_version.get(payload["sub"], 0)
+
+TOKEN_REVOCATION_REFRESH_SECONDS = float(os.environ.get('TOKEN_REVOCATION_REFRESH_SECONDS', '30'))
+token_revocations = TokenRevocations()
+
+def decode_access_token(token: str) -> dict:
+    """Verifies signature, expiry and revocation; returns the claims or raises 401."""
     credentials_exception = HTTPException(
         status_code=401,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
+    digest = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(digest)
+    if payload is None:
+        from jose import JWTError, jwt
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            raise credentials_exception
+        if payload.get("sub") is None:
             raise credentials_exception
-        token_data = TokenData(user_id=user_id)
-    except JWTError:
+        token_cache.set(digest, payload, ttl_seconds=payload.get("exp", 0) - time.time())
+    if token_revocations.is_revoked(payload):
         raise credentials_exception
-    
-    user = await db.users.find_one({"_id": token_data.user_id})
+    return payload
+
+async def load_principal(user_id: str) -> dict:
+    # Handlers get the projected principal; treat it as read-only, it is shared
+    # with every other request from the same user until it expires.
+    user = user_principal_cache.get(user_id)
     if user is None:
-        raise HTTPException(status_code=404, detail="User not found")
+        user = await db.users.find_one({"_id": user_id}, USER_PRINCIPAL_PROJECTION)
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        user_principal_cache.set(user_id, user)
     return user
 
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    payload = decode_access_token(credentials.credentials)
+    token_data = TokenData(user_id=payload["sub"])
+    return await load_principal(token_data.user_id)
+
 # --- Admin-only dependency ---
-async def verify_admin(current_user: dict = Depends(get_current_user)):
+async def verify_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Authorizes from the token's claims alone; admin routes never read the user."""
     if not ADMIN_EMAIL:
         raise HTTPException(status_code=500, detail="Admin email not configured")
-    
-    if current_user.get('email') != ADMIN_EMAIL:
+    payload = decode_access_token(credentials.credentials)
+
+    if "role" in payload:
+        email = payload.get("email")
+        # The email check also retires admin tokens when ADMIN_EMAIL changes.
+        is_admin = payload["role"] == "admin" and email == ADMIN_EMAIL
+    else:
+        # Issued before tokens carried claims; these expire within ACCESS_TOKEN_EXPIRE_MINUTES.
+        email = (await load_principal(payload["sub"])).get("email")
+        is_admin = email == ADMIN_EMAIL
+    if not is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
-    
-    return current_user
+
+    return {"_id": payload["sub"], "email": email}
+
+# --- Rate Limiting ---
+# Per-IP and per-user limits on the routes that cost bcrypt CPU or writes:
+# login, register, reviews, coupon validation and checkout. Each limit is a
+# token bucket, implemented as GCRA (one "theoretical arrival time" per key):
+# `count` requests may burst, then one more every period/count seconds.
+#
+# RATE_LIMIT_BACKEND=memory keeps buckets in this worker, so under gunicorn the
+# effective limit is per worker. RATE_LIMIT_BACKEND=mongo shares them across
+# workers and hosts through the rate_limits collection, at one atomic
+# find_one_and_update per checked request. Client IPs come from uvicorn, which
+# honours X-Forwarded-For from FORWARDED_ALLOW_IPS (set it to the proxy's address).
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')  # memory | mongo
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))  # memory backend, LRU beyond this
+RATE_LIMIT_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# rule -> scope -> "<count>/<period>". Override one with RATE_LIMIT_<RULE>_<SCOPE>,
+# e.g. RATE_LIMIT_LOGIN_IP=60/minute. For login, "user" is the account being
+# signed into; elsewhere it is the authenticated user.
+RATE_LIMIT_DEFAULTS = {
+    "login": {"ip": "20/minute", "user": "5/minute"},
+    "register": {"ip": "5/minute"},
+    "reviews": {"ip": "20/minute", "user": "5/minute"},
+    "coupon_validate": {"ip": "30/minute", "user": "20/minute"},
+    "checkout": {"ip": "30/minute", "user": "20/minute"},
+}
+
+RATE_LIMITED = Counter(
+    "rate_limited_requests_total", "Requests refused with a 429 by the rate limiter.",
+    ["rule", "scope"]
+)
+
+class RateLimit:
+    def __init__(self, spec: str):
+        count, period = spec.split("/")
+        self.count = int(count)
+        self.period = RATE_LIMIT_PERIODS[period.strip().rstrip("s")]
+        self.interval = self.period / self.count  # one token back every interval
+        self.tolerance = self.period - self.interval  # how far ahead of now the bucket may run
+
+RATE_LIMIT_RULES = {
+    rule: {scope: RateLimit(os.environ.get(f"RATE_LIMIT_{rule.upper()}_{scope.upper()}", spec)) for scope, spec in scopes.items()}
+    for rule, scopes in RATE_LIMIT_DEFAULTS.items()
+}
+
+class MemoryRateLimitStore:
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._tat: "OrderedDict[str, float]" = OrderedDict()
+
+    async def peek(self, key: str, now: float, limit: RateLimit) -> float:
+        """Like hit() but takes no token."""
+        return max(0.0, self._tat.get(key, now) - now - limit.tolerance)
+
+    async def hit(self, key: str, now: float, limit: RateLimit) -> float:
+        """Takes a token; returns 0 if allowed, else the seconds until one is available."""
+        tat = max(self._tat.get(key, now), now)
+        if tat - now > limit.tolerance:
+            return tat - now - limit.tolerance
+        self._tat[key] = tat + limit.interval
+        self._tat.move_to_end(key)
+        while len(self._tat) > self.max_keys:
+            self._tat.popitem(last=False)  # least recently seen; forgetting a bucket only refills it
+        return 0.0
+
+class MongoRateLimitStore:
+    """The same GCRA step as MemoryRateLimitStore, done atomically by an update pipeline."""
+    async def peek(self, key: str, now: float, limit: RateLimit) -> float:
+        doc = await db.rate_limits.find_one({"_id": key}, {"tat": 1})
+        return max(0.0, (doc or {}).get("tat", now) - now - limit.tolerance)
+
+    async def hit(self, key: str, now: float, limit: RateLimit) -> float:
+        tat = {"$max": [{"$ifNull": ["$tat", now]}, now]}
+        allowed = {"$lte": [{"$subtract": [tat, now]}, limit.tolerance]}
+        doc = await db.rate_limits.find_one_and_update(
+            {"_id": key},
+            [{"$set": {
+                "allowed": allowed,
+                "tat": {"$cond": [allowed, {"$add": [tat, limit.interval]}, tat]},
+                # By then the bucket is full again and the document can go.
+                "expires_at": datetime.fromtimestamp(now + limit.period, timezone.utc),
+            }}],
+            projection={"allowed": 1, "tat": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return 0.0 if doc["allowed"] else doc["tat"] - now - limit.tolerance
+
+class RateLimiter:
+    def __init__(self, store, rules: Dict[str, Dict[str, RateLimit]]):
+        self.store = store
+        self.rules = rules
+
+    async def check(self, rule: str, ip: Optional[str] = None, user: Optional[str] = None, charge: bool = True):
+        """
+        Raises a 429 with Retry-After if any applicable limit is exhausted.
+        charge=False only looks; pair it with penalize() to count failures only.
+        """
+        if not RATE_LIMIT_ENABLED:
+            return
+        now = time.time()
+        for scope, identity in (("ip", ip), ("user", user)):
+            limit = self.rules[rule].get(scope)
+            if limit is None or not identity:
+                continue
+            key = f"{rule}:{scope}:{hashlib.sha256(identity.encode()).hexdigest()[:32]}"
+            try:
+                retry_after = await (self.store.hit if charge else self.store.peek)(key, now, limit)
+            except Exception as e:
+                # Fail open: a limiter outage must not lock everyone out of login.
+                logger.error(f"Rate limit check failed for {rule}/{scope}: {e}")
+                continue
+            if retry_after > 0:
+                RATE_LIMITED.labels(rule, scope).inc()
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many requests. Please try again later.",
+                    headers={"Retry-After": str(math.ceil(retry_after))},
+                )
+
+    async def penalize(self, rule: str, user: str):
+        """Takes a token from the user bucket without refusing this request."""
+        limit = self.rules[rule].get("user")
+        if not RATE_LIMIT_ENABLED or limit is None:
+            return
+        key = f"{rule}:user:{hashlib.sha256(user.encode()).hexdigest()[:32]}"
+        try:
+            await self.store.hit(key, time.time(), limit)
+        except Exception as e:
+            logger.error(f"Rate limit update failed for {rule}/user: {e}")
+
+rate_limiter = RateLimiter(
+    MongoRateLimitStore() if RATE_LIMIT_BACKEND == "mongo" else MemoryRateLimitStore(RATE_LIMIT_MAX_KEYS),
+    RATE_LIMIT_RULES
+)
+if RATE_LIMIT_BACKEND == "mongo":
+    # Expired buckets are full buckets; let the TTL monitor drop them.
+    INDEX_SPECS.append({"collection": "rate_limits", "keys": [("expires_at", ASCENDING)], "expire_after_seconds": 0})
+
+def token_subject(request: Request) -> Optional[str]:
+    """The user id of a valid bearer token, or None (anonymous or invalid)."""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return decode_access_token(token)["sub"]
+    except HTTPException:
+        return None
+
+def rate_limited(rule: str, by_token: bool = True):
+    """
+    Route dependency: limits by client IP, and by user when the request carries
+    a valid token. Rules whose user scope is keyed by the handler (login, per
+    account) pass by_token=False so a bearer token can't spend that budget.
+    """
+    async def dependency(request: Request):
+        ip = request.client.host if request.client else None
+        await rate_limiter.check(rule, ip=ip, user=token_subject(request) if by_token else None)
+    return dependency
 
 # --- END DEPENDENCIES ---
 
@@ -184,11 +1199,31 @@ class Product(BaseModel):
     featured: bool = False
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+class PriceRange(BaseModel):
+    min: Optional[float] = None
+    max: Optional[float] = None
+
+class ProductFacets(BaseModel):
+    category: List[FacetCount]
+    fit: List[FacetCount]
+    color: List[FacetCount]
+    size: List[FacetCount]
+    price: PriceRange
+
 class PaginatedProducts(BaseModel):
     products: List[Product]
     total_products: int
     total_pages: int
     current_page: int
+    # Opaque keyset cursors; pass back as ?cursor= instead of ?page=
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+    # Only populated when requested with ?facets=true
+    facets: Optional[ProductFacets] = None
 
 class ProductCreate(BaseModel):
     name: str = Field(..., min_length=3, max_length=100)
@@ -402,6 +1437,180 @@ class AdminReturnAction(BaseModel):
 # --- END MODELS ---
 
 
+# --- Fast JSON Responses ---
+# Hot read routes return documents that are already shaped like their
+# response_model. Re-validating them through Pydantic and then encoding with
+# the stdlib json module is pure overhead, so those routes opt in to sending
+# them straight to orjson. Set FAST_JSON_RESPONSES=false to fall back to the
+# validated path.
+FAST_JSON_RESPONSES = os.environ.get('FAST_JSON_RESPONSES', 'true').lower() == 'true'
+
+def model_projection(model) -> dict:
+    """Mongo projection returning exactly the model's fields."""
+    return {"_id": 0, **{name: 1 for name in model.model_fields}}
+
+def model_defaults(model) -> dict:
+    """Static field defaults, to fill fields missing from documents written by older code."""
+    return {
+        name: field.default for name, field in model.model_fields.items()
+        if field.default is not PydanticUndefined and field.default_factory is None
+    }
+
+def defaults_filler(model):
+    """
+    doc -> doc with model_defaults() filled in, recursing into fields that hold
+    a model or a list of models (e.g. order items), as validation would.
+    """
+    defaults = model_defaults(model)
+    nested = {}
+    for name, field in model.model_fields.items():
+        annotation, many = field.annotation, False
+        if get_origin(annotation) is Union:  # Optional[...]
+            annotation = next((arg for arg in get_args(annotation) if arg is not type(None)), annotation)
+        if get_origin(annotation) is list:
+            annotation, many = get_args(annotation)[0], True
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            nested[name] = (defaults_filler(annotation), many)
+
+    def fill(doc: dict) -> dict:
+        doc = {**defaults, **doc}
+        for name, (fill_nested, many) in nested.items():
+            value = doc.get(name)
+            if many and isinstance(value, list):
+                doc[name] = [fill_nested(item) if isinstance(item, dict) else item for item in value]
+            elif not many and isinstance(value, dict):
+                doc[name] = fill_nested(value)
+        return doc
+    return fill
+
+PRODUCT_PROJECTION = model_projection(Product)
+fill_product_defaults = defaults_filler(Product)
+ORDER_PROJECTION = model_projection(Order)
+fill_order_defaults = defaults_filler(Order)
+
+def trusted_json_response(payload, response: Optional[Response] = None):
+    """
+    Serializes trusted documents with orjson, skipping response_model validation.
+    Only pass documents fetched with model_projection() (and defaults filled).
+    """
+    if not FAST_JSON_RESPONSES:
+        return payload
+    return ORJSONResponse(payload, headers=dict(response.headers) if response is not None else None)
+
+
+# --- Response Compression ---
+# Admin list routes return up to thousands of documents. Bodies under
+# COMPRESSION_MIN_BYTES are sent as-is (the CPU cost outweighs a packet or
+# two saved). The default levels are the last step where the extra CPU still
+# buys more transfer time than it costs on a 10 Mbit/s client, measured on
+# our JSON with bench/bench_compression.py: past gzip 5 and brotli 1 the
+# extra savings are a few KiB for 2-10x the CPU.
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '1'))
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript")
+
+COMPRESSION_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+# Prometheus metrics rather than a module dict, so /api/admin/compression-stats
+# reports every gunicorn worker, not just the one that answered.
+COMPRESSION_BYTES = Counter(
+    "http_compression_bytes_total", "Response body bytes before (in) and after (out) compression.",
+    ["encoding", "stage"]
+)
+COMPRESSION_SECONDS = Histogram(
+    "http_compression_duration_seconds", "Time spent compressing one response body.",
+    ["encoding"], buckets=COMPRESSION_BUCKETS
+)
+_compression_opt_out = set()
+
+def skip_compression(endpoint):
+    """Route decorator: never compress this endpoint's responses."""
+    _compression_opt_out.add(endpoint)
+    return endpoint
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    if brotli is not None and weights.get("br", 0) > 0:
+        return "br"
+    if weights.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+class CompressionMiddleware:
+    """
+    gzip/brotli for complete (non-streaming) responses. Responses that already
+    carry a Content-Encoding (pre-compressed payloads), non-text types and
+    @skip_compression endpoints pass through untouched.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers", []))
+        encoding = negotiate_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough or start_message is None:
+                return await send(message)
+
+            response_headers = MutableHeaders(raw=start_message["headers"])
+            body = message.get("body", b"")
+            compressible = (
+                response_headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                and "content-encoding" not in response_headers
+                and scope.get("endpoint") not in _compression_opt_out
+            )
+            if compressible:
+                response_headers.add_vary_header("Accept-Encoding")
+            if not compressible or message.get("more_body", False) or len(body) < COMPRESSION_MIN_BYTES:
+                passthrough = True
+                await send(start_message)
+                return await send(message)
+
+            started = time.perf_counter()
+            compressed = compress_body(body, encoding)
+            elapsed = time.perf_counter() - started
+            COMPRESSION_BYTES.labels(encoding, "in").inc(len(body))
+            COMPRESSION_BYTES.labels(encoding, "out").inc(len(compressed))
+            COMPRESSION_SECONDS.labels(encoding).observe(elapsed)
+
+            response_headers["Content-Encoding"] = encoding
+            response_headers["Content-Length"] = str(len(compressed))
+            # A strong ETag names exact bytes, so each encoding gets its own.
+            etag = response_headers.get("etag")
+            if etag and etag.endswith('"') and not etag.startswith("W/"):
+                response_headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
+
+
 # --- Coupon Helper Function ---
 async def apply_coupon_discount(total_amount: float, code: str):
     coupon = await db.coupons.find_one({"code": code.upper()})
@@ -439,11 +1648,794 @@ async def apply_coupon_discount(total_amount: float, code: str):
     return final_amount, discount_amount, coupon, "Coupon applied successfully"
 
 
+# --- Cache Versions ---
+# Cached data is tagged with a version counter stored in Mongo, so a write on
+# any worker invalidates caches on all of them. Each worker re-reads a counter
+# at most every CACHE_VERSION_POLL_SECONDS, which bounds cross-worker staleness.
+CACHE_VERSION_POLL_SECONDS = float(os.environ.get('CACHE_VERSION_POLL_SECONDS', '5'))
+
+class VersionCounter:
+    def __init__(self, name: str):
+        self.name = name
+        self.value: Optional[int] = None
+        self.checked_at = 0.0
+        self._listeners = []
+
+    def on_change(self, callback):
+        """Registers a callback fired when another worker's bump is observed."""
+        self._listeners.append(callback)
+
+    def _observe(self, value: int, expected: Optional[int] = None):
+        remote_change = self.value is not None and value != (self.value if expected is None else expected)
+        self.value = value
+        self.checked_at = time.monotonic()
+        if remote_change:
+            for callback in self._listeners:
+                callback()
+
+    async def current(self) -> int:
+        if self.value is None or time.monotonic() - self.checked_at >= CACHE_VERSION_POLL_SECONDS:
+            doc = await db.cache_versions.find_one({"_id": self.name})
+            self._observe((doc or {}).get("version", 0))
+        return self.value
+
+    async def bump(self) -> int:
+        previous = self.value
+        doc = await db.cache_versions.find_one_and_update(
+            {"_id": self.name},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        # Only our own increment in between means nothing else changed.
+        self._observe(doc["version"], expected=None if previous is None else previous + 1)
+        return self.value
+
+# Bumped by product writes and every route that changes stock.
+catalog_version = VersionCounter("catalog")
+# Bumped only when a write touches a featured product (or the featured flag).
+featured_version = VersionCounter("featured")
+landing_page_version = VersionCounter("landing_page")
+ticker_version = VersionCounter("ticker")
+
+
+# --- Conditional GET ---
+# ETags are derived from the shared version counters (plus the request
+# variant), so they agree across workers and a 304 can be answered before any
+# database read or serialization. Catalog data carries stock, so browsers must
+# revalidate every time; storefront settings may be reused for a minute.
+CATALOG_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+SETTINGS_CACHE_CONTROL = "public, max-age=60, must-revalidate"
+
+def make_etag(name: str, version: int, *variant) -> str:
+    tag = f"{name}-{version}"
+    if variant:
+        tag += "-" + hashlib.sha1(json.dumps(variant, default=str).encode()).hexdigest()[:16]
+    return f'"{tag}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison (RFC 9110 13.1.2). Clients echo the
+    # encoding-specific tag CompressionMiddleware sent, so strip that suffix.
+    for candidate in header.split(","):
+        candidate = candidate.strip().removeprefix("W/")
+        if candidate == etag or re.sub(r'-(gzip|br)"$', '"', candidate) == etag:
+            return True
+    return False
+
+def conditional_response(request: Request, response: Response, etag: str, cache_control: str) -> Optional[Response]:
+    """Returns a 304 if the client already has this version; otherwise tags the outgoing response."""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+# --- Storefront Payload Cache ---
+# The landing page, ticker and featured list are identical for every visitor.
+# They are kept as ready-to-send JSON bytes (plus gzip/brotli variants
+# compressed once at maximum level) and rebuilt only when their version
+# counter moves, so a HomePage load is a dict lookup. A rebuild runs once per
+# worker and version (a per-name lock), with the compression on a thread.
+PRECOMPRESS_PAYLOADS = os.environ.get('PRECOMPRESS_PAYLOADS', 'true').lower() == 'true'
+
+class StaticPayload:
+    def __init__(self, version: int, payload):
+        self.version = version
+        self.body = orjson.dumps(payload)
+        self.encoded: Dict[str, bytes] = {}
+
+    def precompress(self):
+        """CPU-heavy at these levels; called off the event loop."""
+        if PRECOMPRESS_PAYLOADS and len(self.body) >= COMPRESSION_MIN_BYTES:
+            self.encoded["gzip"] = gzip.compress(self.body, compresslevel=9)
+            if brotli is not None:
+                self.encoded["br"] = brotli.compress(self.body, quality=11)
+        return self
+
+_static_payloads: Dict[str, StaticPayload] = {}
+_static_payload_locks: Dict[str, asyncio.Lock] = {}
+
+async def serve_static_payload(request: Request, name: str, counter: VersionCounter, build, cache_control: str) -> Response:
+    """Serves `name` from pre-encoded bytes, calling build() only after counter has moved."""
+    version = await counter.current()
+    entry = _static_payloads.get(name)
+    if entry is None or entry.version != version:
+        async with _static_payload_locks.setdefault(name, asyncio.Lock()):
+            entry = _static_payloads.get(name)
+            if entry is None or entry.version != version:
+                entry = StaticPayload(version, await build())
+                await asyncio.get_running_loop().run_in_executor(None, entry.precompress)
+                _static_payloads[name] = entry
+
+    etag = make_etag(name, version)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    if encoding in entry.encoded:
+        headers.update({"Content-Encoding": encoding, "Vary": "Accept-Encoding", "ETag": f'{etag[:-1]}-{encoding}"'})
+        return Response(content=entry.encoded[encoding], media_type="application/json", headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+# --- Query Cache ---
+CACHE_REGISTRY: Dict[str, "QueryCache"] = {}
+
+class QueryCache:
+    """Size-bounded LRU with a TTL per entry, plus hit/miss counters."""
+    def __init__(self, name: str, max_entries: int, ttl_seconds: float):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        CACHE_REGISTRY[name] = self
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl_seconds: Optional[float] = None):
+        """ttl_seconds shortens this entry's lifetime below the cache-wide TTL."""
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+# get_products responses (product slice + totals), keyed by catalog version and
+# the normalized query.
+product_listing_cache = QueryCache(
+    "product_listing",
+    max_entries=int(os.environ.get('LISTING_CACHE_MAX_ENTRIES', '512')),
+    ttl_seconds=float(os.environ.get('LISTING_CACHE_TTL_SECONDS', '300'))
+)
+catalog_version.on_change(product_listing_cache.clear)
+
+# The authenticated user as get_current_user hands it to handlers, keyed by user
+# id. Holds only what handlers read, not the password hash or the wishlist;
+# /profile loads the full document itself. Writes to a user invalidate it in this
+# worker, and the short TTL bounds how stale other workers can be.
+USER_PRINCIPAL_PROJECTION = {"_id": 1, "email": 1, "name": 1}
+USER_PROFILE_PROJECTION = {"hashed_password": 0}
+user_principal_cache = QueryCache(
+    "user_principal",
+    max_entries=int(os.environ.get('USER_CACHE_MAX_ENTRIES', '10000')),
+    ttl_seconds=float(os.environ.get('USER_CACHE_TTL_SECONDS', '30'))
+)
+
+# Verified JWT claims keyed by the token's SHA-256 digest, so an active session
+# pays for HMAC verification and claim parsing once rather than per request.
+# Entries never outlive the token's exp; revocation is still checked per request.
+token_cache = QueryCache(
+    "decoded_tokens",
+    max_entries=int(os.environ.get('TOKEN_CACHE_MAX_ENTRIES', '10000')),
+    ttl_seconds=float(os.environ.get('TOKEN_CACHE_TTL_SECONDS', '600'))
+)
+
+
+# --- Product Read Cache ---
+class ProductCache:
+    """
+    LRU+TTL cache of product documents addressable by id and by slug, plus the
+    featured list. Memory is bounded by the serialized size of what is held,
+    not by entry count, since variant-heavy products vary a lot in size.
+    """
+    def __init__(self, name: str, max_bytes: int, ttl_seconds: float):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._by_id: "OrderedDict[str, tuple]" = OrderedDict()  # id -> (expires_at, doc, size)
+        self._slug_to_id: Dict[str, str] = {}
+        self._retired_slug_to_id: Dict[str, str] = {}
+        self._featured: Optional[tuple] = None  # (expires_at, docs, size)
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        CACHE_REGISTRY[name] = self
+
+    def _lookup(self, product_id: Optional[str]) -> Optional[dict]:
+        entry = self._by_id.get(product_id) if product_id else None
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._drop(product_id)
+            self.misses += 1
+            return None
+        self._by_id.move_to_end(product_id)
+        self.hits += 1
+        return entry[1]
+
+    def get(self, slug_or_id: str) -> Optional[dict]:
+        product_id = (
+            slug_or_id if slug_or_id in self._by_id
+            else self._slug_to_id.get(slug_or_id) or self._retired_slug_to_id.get(slug_or_id)
+        )
+        return self._lookup(product_id)
+
+    def put(self, doc: dict, retired_slug: Optional[str] = None):
+        size = len(json.dumps(doc, default=str))
+        if size > self.max_bytes:
+            return
+        self._drop(doc["id"])
+        self._by_id[doc["id"]] = (time.monotonic() + self.ttl_seconds, doc, size)
+        if doc.get("slug"):
+            self._slug_to_id[doc["slug"]] = doc["id"]
+        # A retired slug is mapped only once get_product has checked that no
+        # product holds it as id or current slug. Any rename bumps the catalog
+        # version, which clears this cache, so the check holds while cached.
+        if retired_slug:
+            self._retired_slug_to_id[retired_slug] = doc["id"]
+        self.bytes_used += size
+        self._evict()
+
+    def get_featured(self) -> Optional[List[dict]]:
+        if self._featured is None or self._featured[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._featured[1]
+
+    def put_featured(self, docs: List[dict]):
+        self.invalidate_featured()
+        size = len(json.dumps(docs, default=str))
+        self._featured = (time.monotonic() + self.ttl_seconds, docs, size)
+        self.bytes_used += size
+        self._evict()
+
+    def invalidate(self, product_ids=(), featured: bool = False):
+        """Drops the given products; the featured list goes too if it holds any of them."""
+        for product_id in product_ids:
+            self._drop(product_id)
+        if featured or (self._featured and any(doc["id"] in product_ids for doc in self._featured[1])):
+            self.invalidate_featured()
+
+    def invalidate_featured(self):
+        if self._featured is not None:
+            self.bytes_used -= self._featured[2]
+            self._featured = None
+
+    def clear(self):
+        self._by_id.clear()
+        self._slug_to_id.clear()
+        self._retired_slug_to_id.clear()
+        self._featured = None
+        self.bytes_used = 0
+
+    def _drop(self, product_id: str):
+        entry = self._by_id.pop(product_id, None)
+        if entry is None:
+            return
+        self.bytes_used -= entry[2]
+        slug = entry[1].get("slug")
+        if slug and self._slug_to_id.get(slug) == product_id:
+            del self._slug_to_id[slug]
+        for retired in entry[1].get("previous_slugs") or ():
+            if self._retired_slug_to_id.get(retired) == product_id:
+                del self._retired_slug_to_id[retired]
+
+    def _evict(self):
+        while self.bytes_used > self.max_bytes and self._by_id:
+            self._drop(next(iter(self._by_id)))
+        if self.bytes_used > self.max_bytes:
+            self.invalidate_featured()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._by_id) + (1 if self._featured else 0),
+            "bytes_used": self.bytes_used,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+product_cache = ProductCache(
+    "product",
+    max_bytes=int(os.environ.get('PRODUCT_CACHE_MAX_BYTES', str(8 * 1024 * 1024))),
+    ttl_seconds=float(os.environ.get('PRODUCT_CACHE_TTL_SECONDS', '300'))
+)
+catalog_version.on_change(product_cache.clear)
+
+async def bump_catalog_version(product_ids=(), featured: bool = False):
+    """
+    Call after any write that changes product documents, including stock.
+    product_ids/featured say exactly which cached products are now stale;
+    for stock writes, whether a featured product was touched is looked up.
+    """
+    product_ids = list(product_ids)
+    if not featured and product_ids:
+        featured = await db.products.count_documents({"id": {"$in": product_ids}, "featured": True}, limit=1) > 0
+    await catalog_version.bump()
+    if featured:
+        await featured_version.bump()
+    product_listing_cache.clear()
+    product_facet_cache.clear()
+    product_cache.invalidate(product_ids, featured=featured)
+
+
+# --- Product Search Index ---
+# In-process inverted index over the catalog. A shirt catalog is small enough
+# to hold in memory, which gives us stemming, prefix matching and ranking
+# without the unanchored $regex scan. Product writes on this worker update it
+# directly; writes on other workers are picked up by the periodic rebuild.
+SEARCH_INDEX_TTL_SECONDS = int(os.environ.get('SEARCH_INDEX_TTL_SECONDS', '300'))
+SEARCH_TOKEN_RE = re.compile(r"[a-z0-9]+")
+SEARCH_STOPWORDS = {"a", "an", "and", "for", "in", "of", "on", "or", "the", "to", "with"}
+SEARCH_FIELD_WEIGHTS = {"name": 3.0, "category": 1.5, "fit": 1.5, "colors": 1.5, "description": 1.0}
+
+def stem_token(token: str) -> str:
+    """Light suffix stripping so 'shirts', 'shirting' and 'shirt' share a term."""
+    if len(token) <= 3 or token.isdigit():
+        return token
+    if token.endswith("ies") and len(token) > 4:
+        return token[:-3] + "y"
+    if token.endswith("es") and token[:-2].endswith(("s", "x", "z", "ch", "sh")):
+        return token[:-2]
+    if token.endswith("s") and not token.endswith(("ss", "us")):
+        return token[:-1]
+    for suffix in ("ing", "ed", "ly"):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+def tokenize(text: str) -> List[str]:
+    return [stem_token(t) for t in SEARCH_TOKEN_RE.findall((text or "").lower()) if t not in SEARCH_STOPWORDS]
+
+class ProductSearchIndex:
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self.postings: Dict[str, Dict[str, float]] = {}  # term -> {product_id: weighted term frequency}
+        self.doc_terms: Dict[str, set] = {}
+        self.doc_lengths: Dict[str, float] = {}
+        self.sorted_terms: Optional[List[str]] = None
+        self.built_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def add(self, product: dict):
+        product_id = product["id"]
+        self.remove(product_id)
+        fields = {
+            "name": product.get("name", ""),
+            "description": product.get("description", ""),
+            "category": product.get("category", ""),
+            "fit": product.get("fit", ""),
+            "colors": " ".join(v.get("color", "") for v in product.get("variants", [])),
+        }
+        weights: Dict[str, float] = {}
+        for field, text in fields.items():
+            for term in tokenize(text):
+                weights[term] = weights.get(term, 0.0) + SEARCH_FIELD_WEIGHTS[field]
+        for term, weight in weights.items():
+            self.postings.setdefault(term, {})[product_id] = weight
+        self.doc_terms[product_id] = set(weights)
+        self.doc_lengths[product_id] = sum(weights.values())
+        self.sorted_terms = None
+
+    def remove(self, product_id: str):
+        for term in self.doc_terms.pop(product_id, ()):
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(product_id, None)
+                if not docs:
+                    del self.postings[term]
+        self.doc_lengths.pop(product_id, None)
+        self.sorted_terms = None
+
+    def invalidate(self):
+        """Forces a full rebuild on the next search (bulk writes such as cleanup)."""
+        self.built_at = None
+
+    async def ensure_built(self):
+        if self.built_at is not None and time.monotonic() - self.built_at < self.ttl_seconds:
+            return
+        async with self._lock:
+            if self.built_at is not None and time.monotonic() - self.built_at < self.ttl_seconds:
+                return
+            projection = {"_id": 0, "id": 1, "name": 1, "description": 1, "category": 1, "fit": 1, "variants.color": 1}
+            products = await db.products.find({}, projection).to_list(None)
+            self.postings, self.doc_terms, self.doc_lengths = {}, {}, {}
+            for product in products:
+                self.add(product)
+            self.built_at = time.monotonic()
+            logger.info(f"Product search index built with {len(products)} products and {len(self.postings)} terms.")
+
+    def _expand(self, token: str) -> Dict[str, float]:
+        """Exact stem match at full weight, prefix matches (typing-as-you-go) at half weight."""
+        if self.sorted_terms is None:
+            self.sorted_terms = sorted(self.postings)
+        matches = {token: 1.0} if token in self.postings else {}
+        if len(token) >= 2:
+            start = bisect.bisect_left(self.sorted_terms, token)
+            for term in self.sorted_terms[start:]:
+                if not term.startswith(token):
+                    break
+                matches.setdefault(term, 0.5)
+        return matches
+
+    def search(self, text: str) -> List[tuple]:
+        """
+        Returns [(product_id, score)] best first. Every query term must match
+        (exactly or as a prefix); scoring is BM25 over field-weighted frequencies.
+        """
+        tokens = tokenize(text)
+        if not tokens or not self.doc_lengths:
+            return []
+        n_docs = len(self.doc_lengths)
+        avg_length = sum(self.doc_lengths.values()) / n_docs
+        k1, b = 1.2, 0.75
+        scores: Optional[Dict[str, float]] = None
+        for token in tokens:
+            token_scores: Dict[str, float] = {}
+            for term, boost in self._expand(token).items():
+                docs = self.postings[term]
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for product_id, tf in docs.items():
+                    norm = tf + k1 * (1 - b + b * self.doc_lengths[product_id] / avg_length)
+                    score = boost * idf * tf * (k1 + 1) / norm
+                    token_scores[product_id] = max(token_scores.get(product_id, 0.0), score)
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {pid: s + token_scores[pid] for pid, s in scores.items() if pid in token_scores}
+            if not scores:
+                return []
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+product_search_index = ProductSearchIndex(SEARCH_INDEX_TTL_SECONDS)
+catalog_version.on_change(product_search_index.invalidate)
+
+
+# --- Product Listing Cursors ---
+# Keyset pagination on (sort key, id). The tie-breaker follows the sort
+# direction so each sort is served by walking the (field, id) index.
+PRODUCT_SORTS = {
+    "name": ("name", ASCENDING),
+    "price-low": ("price", ASCENDING),
+    "price-high": ("price", DESCENDING),
+}
+
+def encode_product_cursor(sort: str, product: dict, direction: str, page: int) -> str:
+    field = PRODUCT_SORTS[sort][0]
+    payload = {"s": sort, "v": product.get(field), "id": product["id"], "d": direction, "p": page}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_product_cursor(cursor: str, sort: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if position["d"] not in ("next", "prev") or not isinstance(position["p"], int) or "v" not in position:
+            raise ValueError("malformed cursor")
+        str(position["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if position["s"] != sort:
+        raise HTTPException(status_code=400, detail="Cursor does not match the requested sort")
+    return position
+
+def keyset_filter(field: str, direction: int, value, last_id: str) -> dict:
+    op = "$gt" if direction == ASCENDING else "$lt"
+    return {"$or": [{field: {op: value}}, {field: value, "id": {op: last_id}}]}
+
+
+# --- Sparse Fieldsets ---
+# ?fields=name,price or ?view=card trims product documents in the Mongo
+# projection and validates the response against a model holding only those
+# fields. id is always included (keys, cursors).
+PRODUCT_VIEWS = {
+    "card": ("id", "name", "price", "mrp", "slug", "images"),
+}
+# Cards show one image; the rest are sliced off in the projection.
+PRODUCT_VIEW_PROJECTIONS = {
+    "card": {"images": {"$slice": 1}},
+}
+
+def resolve_product_fields(fields: Optional[str], view: Optional[str]) -> Optional[tuple]:
+    if view is not None and view not in PRODUCT_VIEWS:
+        raise HTTPException(status_code=400, detail=f"Unknown view '{view}'")
+    requested = set(PRODUCT_VIEWS[view]) if view else set()
+    if fields:
+        requested |= {name.strip() for name in fields.split(",") if name.strip()}
+    if not requested:
+        return None
+    unknown = requested - set(Product.model_fields)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown product fields: {', '.join(sorted(unknown))}")
+    return tuple(sorted(requested | {"id"}))
+
+def product_projection(field_names: Optional[tuple], view: Optional[str], sort_field: Optional[str] = None) -> dict:
+    if field_names is None:
+        return PRODUCT_PROJECTION
+    projection = {"_id": 0, **{name: 1 for name in field_names}}
+    if sort_field:
+        projection[sort_field] = 1  # needed to encode cursors; dropped by the response model
+    projection.update(PRODUCT_VIEW_PROJECTIONS.get(view, {}))
+    return projection
+
+@functools.lru_cache(maxsize=64)
+def sparse_listing_model(field_names: tuple):
+    """PaginatedProducts whose products only declare (and validate) field_names."""
+    suffix = "_".join(field_names)
+    product_model = create_model(
+        f"Product_{suffix}",
+        __config__=ConfigDict(extra="ignore"),
+        **{name: (Product.model_fields[name].annotation, Product.model_fields[name]) for name in field_names}
+    )
+    return create_model(f"PaginatedProducts_{suffix}", __base__=PaginatedProducts, products=(List[product_model], ...))
+
+
+# --- Product Facets ---
+def split_facet_values(raw: Optional[str]) -> List[str]:
+    return [value.strip() for value in (raw or "").split(",") if value.strip()]
+
+def facet_condition(values: List[str]):
+    return values[0] if len(values) == 1 else {"$in": values}
+
+def build_product_filters(category, fit, color, size, min_price, max_price) -> dict:
+    """Listing filters; category, fit and color accept comma-separated values."""
+    filters = {}
+    for field, raw in (("category", category), ("fit", fit)):
+        values = split_facet_values(raw)
+        if values:
+            filters[field] = facet_condition(values)
+    # Color and size must hold on the same variant: "M in stock in Blue".
+    variant_match = {}
+    colors = split_facet_values(color)
+    if colors:
+        variant_match["color"] = facet_condition(colors)
+    if size:
+        variant_match[f"sizes.{size}"] = {"$gt": 0}
+    if variant_match:
+        filters["variants"] = {"$elemMatch": variant_match}
+    price = {}
+    if min_price is not None:
+        price["$gte"] = min_price
+    if max_price is not None:
+        price["$lte"] = max_price
+    if price:
+        filters["price"] = price
+    return filters
+
+def count_by(path: str, per_product: bool = False) -> List[dict]:
+    """$group stages counting products per value; per_product dedupes values repeated within one product."""
+    if per_product:
+        return [
+            {"$group": {"_id": {"value": path, "product": "$id"}}},
+            {"$group": {"_id": "$_id.value", "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}},
+        ]
+    return [{"$group": {"_id": path, "count": {"$sum": 1}}}, {"$sort": {"_id": 1}}]
+
+FACET_FILTER_FIELDS = ("category", "fit", "variants", "price")
+
+def facet_query(query: dict, dimension: str) -> Tuple[dict, dict]:
+    """
+    The listing query without `dimension`'s own filter, plus the per-variant
+    conditions left over. Color and size share one $elemMatch, so dropping
+    one keeps the other on the same variant.
+    """
+    query = dict(query)
+    variant_match = dict(query.pop("variants", {}).get("$elemMatch", {}))
+    if dimension == "color":
+        variant_match.pop("color", None)
+    elif dimension == "size":
+        variant_match = {key: value for key, value in variant_match.items() if not key.startswith("sizes.")}
+    else:
+        query.pop(dimension, None)
+    if variant_match:
+        query["variants"] = {"$elemMatch": variant_match}
+    return query, variant_match
+
+def product_facet_stages(query: dict) -> dict:
+    """
+    $facet sub-pipelines. Each dimension is counted with its own filter
+    removed (disjunctive facets), so picking "Blue" still shows how many
+    products the other colors would add. The total uses the full query.
+    """
+    stages = {"total": [{"$match": query}, {"$count": "count"}]}
+    for name in ("category", "fit", "color", "size", "price"):
+        own_query, variant_match = facet_query(query, name)
+        # After $unwind, only count variants that satisfy the other variant filters.
+        per_variant = [
+            {"$unwind": "$variants"},
+            *([{"$match": {f"variants.{key}": value for key, value in variant_match.items()}}] if variant_match else []),
+        ]
+        if name == "color":
+            counts = per_variant + count_by("$variants.color", per_product=True)
+        elif name == "size":
+            counts = per_variant + [
+                {"$project": {"id": 1, "sizes": {"$objectToArray": "$variants.sizes"}}},
+                {"$unwind": "$sizes"},
+                {"$match": {"sizes.v": {"$gt": 0}}},
+            ] + count_by("$sizes.k", per_product=True)
+        elif name == "price":
+            counts = [{"$group": {"_id": None, "min": {"$min": "$price"}, "max": {"$max": "$price"}}}]
+        else:
+            counts = count_by(f"${name}")
+        stages[name] = [{"$match": own_query}] + counts
+    return stages
+
+# Facet counts per (catalog version, search terms, filters); shared by every
+# page and sort of the same filtered listing.
+product_facet_cache = QueryCache(
+    "product_facets",
+    max_entries=int(os.environ.get('FACET_CACHE_MAX_ENTRIES', '256')),
+    ttl_seconds=float(os.environ.get('LISTING_CACHE_TTL_SECONDS', '300'))
+)
+catalog_version.on_change(product_facet_cache.clear)
+
+async def load_product_facets(query: dict, cache_key: tuple) -> dict:
+    result = product_facet_cache.get(cache_key)
+    if result is None:
+        # Filters every facet agrees on (the search hits) narrow the input once.
+        shared = {key: value for key, value in query.items() if key not in FACET_FILTER_FIELDS}
+        rows = await db.products.aggregate([{"$match": shared}, {"$facet": product_facet_stages(query)}]).to_list(1)
+        row = rows[0] if rows else {}
+        price = (row.get("price") or [{}])[0]
+        result = {
+            "total": (row.get("total") or [{"count": 0}])[0]["count"],
+            "facets": {
+                **{
+                    name: [{"value": str(b["_id"]), "count": b["count"]} for b in row.get(name, []) if b["_id"] is not None]
+                    for name in ("category", "fit", "color", "size")
+                },
+                "price": {"min": price.get("min"), "max": price.get("max")},
+            }
+        }
+        product_facet_cache.set(cache_key, result)
+    return result
+
+
+# --- Co-purchase Recommendations ---
+# "Customers also bought": item-item co-occurrence over the baskets of paid
+# orders. The matrix is built in batch with scipy.sparse and then kept as
+# per-product count maps so verify_payment can fold new baskets in without a
+# rebuild. Top-k neighbours are precomputed, so serving is a dict lookup.
+RECOMMENDATION_TOP_K = int(os.environ.get('RECOMMENDATION_TOP_K', '8'))
+RECOMMENDATION_REBUILD_SECONDS = int(os.environ.get('RECOMMENDATION_REBUILD_SECONDS', '3600'))
+PAID_ORDER_STATUSES = ["processing", "shipped", "delivered"]
+
+def build_co_purchase_matrix(baskets: List[set], top_k: int):
+    """Returns ({product_id: {other_id: co_count}}, {product_id: [top-k other ids]})."""
+    product_ids = sorted({product_id for basket in baskets for product_id in basket})
+    if not product_ids:
+        return {}, {}
+    import numpy as np
+    from scipy import sparse
+
+    index = {product_id: i for i, product_id in enumerate(product_ids)}
+    rows = [r for r, basket in enumerate(baskets) for _ in basket]
+    cols = [index[product_id] for basket in baskets for product_id in basket]
+    incidence = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+        shape=(len(baskets), len(product_ids))
+    )
+    co_occurrence = (incidence.T @ incidence).tocsr()
+    co_occurrence.setdiag(0)
+    co_occurrence.eliminate_zeros()
+
+    counts, neighbours = {}, {}
+    for i, product_id in enumerate(product_ids):
+        start, end = co_occurrence.indptr[i], co_occurrence.indptr[i + 1]
+        cols_i, values = co_occurrence.indices[start:end], co_occurrence.data[start:end]
+        if not len(values):
+            continue
+        counts[product_id] = {product_ids[j]: int(v) for j, v in zip(cols_i, values)}
+        # Stable sort over column order keeps ties deterministic (by product id).
+        order = np.argsort(-values, kind="stable")[:top_k]
+        neighbours[product_id] = [product_ids[cols_i[j]] for j in order]
+    return counts, neighbours
+
+class CoPurchaseRecommender:
+    def __init__(self, top_k: int, rebuild_seconds: int):
+        self.top_k = top_k
+        self.rebuild_seconds = rebuild_seconds
+        self.counts: Dict[str, Dict[str, int]] = {}
+        self.neighbours: Dict[str, List[str]] = {}
+        self.built_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def ensure_built(self):
+        # Other workers' incremental updates only arrive through a rebuild.
+        if self.built_at is not None and time.monotonic() - self.built_at < self.rebuild_seconds:
+            return
+        async with self._lock:
+            if self.built_at is not None and time.monotonic() - self.built_at < self.rebuild_seconds:
+                return
+            orders = await db.orders.find(
+                {"status": {"$in": PAID_ORDER_STATUSES}}, {"_id": 0, "items.product_id": 1}
+            ).to_list(None)
+            baskets = [{item["product_id"] for item in order.get("items", [])} for order in orders]
+            baskets = [basket for basket in baskets if len(basket) > 1]
+            started = time.perf_counter()
+            self.counts, self.neighbours = await asyncio.get_running_loop().run_in_executor(
+                None, build_co_purchase_matrix, baskets, self.top_k
+            )
+            self.built_at = time.monotonic()
+            logger.info(
+                f"Co-purchase matrix built from {len(baskets)} baskets for {len(self.counts)} products "
+                f"in {(time.perf_counter() - started) * 1000:.1f} ms."
+            )
+
+    def record_basket(self, product_ids):
+        """Folds one newly paid basket into the counts and refreshes the affected top-k lists."""
+        basket = set(product_ids)
+        if self.built_at is None or len(basket) < 2:
+            return
+        for a, b in itertools.permutations(basket, 2):
+            row = self.counts.setdefault(a, {})
+            row[b] = row.get(b, 0) + 1
+        for product_id in basket:
+            row = self.counts[product_id]
+            self.neighbours[product_id] = heapq.nsmallest(self.top_k, row, key=lambda other: (-row[other], other))
+
+    def invalidate(self):
+        self.built_at = None
+
+    def recommend(self, product_id: str) -> List[str]:
+        return self.neighbours.get(product_id, [])
+
+co_purchase_recommender = CoPurchaseRecommender(RECOMMENDATION_TOP_K, RECOMMENDATION_REBUILD_SECONDS)
+
+
 # --- Ticker Routes ---
 ticker_router = APIRouter(prefix="/api/ticker")
 
 @ticker_router.get("/", response_model=TickerSettings)
-async def get_ticker_settings():
+async def get_ticker_settings(request: Request):
+    return await serve_static_payload(request, "ticker", ticker_version, load_ticker_settings, SETTINGS_CACHE_CONTROL)
+
+async def load_ticker_settings():
     settings = await db.ticker_settings.find_one({"id": "ticker_settings"}, {"_id": 0})
     if not settings:
         default_settings = TickerSettings()
@@ -460,6 +2452,7 @@ async def update_ticker_settings(settings: TickerUpdate, user: dict = Depends(ve
         {"$set": update_data},
         upsert=True
     )
+    await ticker_version.bump()
     updated_settings = await db.ticker_settings.find_one({"id": "ticker_settings"}, {"_id": 0})
     return updated_settings
 
@@ -467,7 +2460,7 @@ async def update_ticker_settings(settings: TickerUpdate, user: dict = Depends(ve
 # --- Coupon Routes ---
 coupon_router = APIRouter(prefix="/api/coupons")
 
-@coupon_router.post("/validate", response_model=CouponResponse)
+@coupon_router.post("/validate", response_model=CouponResponse, dependencies=[Depends(rate_limited("coupon_validate"))])
 async def validate_coupon(data: CouponValidation):
     total_amount = data.total_amount
     code = data.code.upper()
@@ -517,37 +2510,49 @@ async def delete_coupon(coupon_id: str, user: dict = Depends(verify_admin)):
 
 auth_router = APIRouter(prefix="/api/auth")
 
-@auth_router.post("/register", response_model=UserProfile) # RATE LIMIT REMOVED
+@auth_router.post("/register", response_model=UserProfile, dependencies=[Depends(rate_limited("register"))])
 async def register_user(user: UserCreate):
-    existing_user = await db.users.find_one({"email": user.email})
+    email = user.email.lower()
+    existing_user = await db.users.find_one({"email": email})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_pass = hash_password(user.password)
+    hashed_pass = await hash_password_async(user.password)
     user_id = str(uuid.uuid4())
     
     new_profile = {
         "_id": user_id,
-        "email": user.email.lower(),
+        "email": email,
         "name": user.name,
         "hashed_password": hashed_pass,
         "shipping_address": ShippingAddress().model_dump(),
         "wishlist": [],
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    await db.users.insert_one(new_profile)
+    try:
+        await db.users.insert_one(new_profile)
+    except DuplicateKeyError:  # a concurrent registration won the unique index
+        raise HTTPException(status_code=400, detail="Email already registered")
     return new_profile
 
-@auth_router.post("/login", response_model=Token) # RATE LIMIT REMOVED
+@auth_router.post("/login", response_model=Token, dependencies=[Depends(rate_limited("login", by_token=False))])
+@skip_compression # Never compress responses carrying secrets (BREACH)
 async def login_for_access_token(form_data: UserLogin):
-    user = await db.users.find_one({"email": form_data.email.lower()})
-    if not user or not user.get("hashed_password") or not verify_password(form_data.password, user.get("hashed_password")):
+    # Per account as well as per IP, so credential stuffing from many addresses
+    # still can't grind through one account's bcrypt checks. Only failed
+    # attempts count against the account; otherwise anyone could keep its
+    # owner locked out just by sending logins for it.
+    email = form_data.email.lower()
+    await rate_limiter.check("login", user=email, charge=False)
+    user = await db.users.find_one({"email": email})
+    if not user or not user.get("hashed_password") or not await verify_password_async(form_data.password, user.get("hashed_password")):
+        await rate_limiter.penalize("login", user=email)
         raise HTTPException(
             status_code=401,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": user["_id"]})
+    access_token = create_access_token(data=token_claims(user))
     return {"access_token": access_token, "token_type": "bearer"}
 
 # Removed: /google/login and /google/callback endpoints
@@ -563,64 +2568,200 @@ async def create_product(product: ProductCreate, user: dict = Depends(verify_adm
     product_obj = Product(**product_dict)
     doc = product_obj.model_dump()
     await db.products.insert_one(doc)
+    product_search_index.add(doc)
+    await bump_catalog_version([doc['id']], featured=doc['featured'])
     return product_obj
 
 @api_router.get("/products", response_model=PaginatedProducts)
 async def get_products(
+    request: Request,
+    response: Response,
     search: Optional[str] = None, 
     sort: Optional[str] = 'name',
     page: int = 1,
-    limit: int = 12
+    limit: int = 12,
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    fit: Optional[str] = None,
+    color: Optional[str] = None,
+    size: Optional[str] = Query(None, pattern="^[A-Za-z0-9]+$", description="Only products with this size in stock"),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    facets: bool = False,
+    fields: Optional[str] = Query(None, description="Comma-separated product fields to return"),
+    view: Optional[str] = Query(None, description="Named field preset, e.g. 'card'")
+):
+    # Search results depend only on the token list, so key on that rather than
+    # the raw string ("Shirts " and "shirt" share an entry).
+    terms = " ".join(tokenize(search)) if search else ""
+    if sort == 'relevance' and not terms:
+        sort = 'name'
+    elif sort not in PRODUCT_SORTS and sort != 'relevance':
+        sort = 'name'
+    filters = build_product_filters(category, fit, color, size, min_price, max_price)
+    filter_key = json.dumps(filters, sort_keys=True)
+    field_names = resolve_product_fields(fields, view)
+    version = await catalog_version.current()
+    cache_key = (version, terms, filter_key, sort, cursor or page, limit, facets, field_names, view if field_names else None)
+    etag = make_etag("products", *cache_key)
+    if not_modified := conditional_response(request, response, etag, CATALOG_CACHE_CONTROL):
+        return not_modified
+    listing = product_listing_cache.get(cache_key)
+    if listing is None:
+        facet_key = (version, terms, filter_key) if facets else None
+        projection = product_projection(field_names, view, PRODUCT_SORTS.get(sort, (None,))[0])
+        listing = await query_product_listing(
+            search if terms else None, sort, page, limit, cursor, filters, facet_key, projection
+        )
+        product_listing_cache.set(cache_key, listing)
+    if field_names is None:
+        return trusted_json_response(listing, response)
+    # Bypass the full Product response model, which would reject the trimmed documents.
+    body = sparse_listing_model(field_names).model_validate(listing).model_dump_json()
+    return Response(content=body, media_type="application/json", headers=dict(response.headers))
+
+async def query_product_listing(
+    search: Optional[str], sort: str, page: int, limit: int, cursor: Optional[str],
+    filters: dict, facet_key: Optional[tuple] = None, projection: Optional[dict] = None
 ):
-    query = {}
+    projection = projection or PRODUCT_PROJECTION
+    query = dict(filters)
+    skip = (page - 1) * limit
     if search:
-        query["$or"] = [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}}
-        ]
-    if sort == 'price-low':
-        sort_criteria = [("price", ASCENDING)]
-    elif sort == 'price-high':
-        sort_criteria = [("price", DESCENDING)]
-    else:
-        sort_criteria = [("name", ASCENDING)]
-    total_products = await db.products.count_documents(query)
+        if sort == 'relevance' and cursor:
+            raise HTTPException(status_code=400, detail="Cursor pagination is not supported for relevance sort")
+        await product_search_index.ensure_built()
+        ranked_ids = [product_id for product_id, _ in product_search_index.search(search)]
+        query["id"] = {"$in": ranked_ids}
+
+    # With facets requested, the same aggregation that counts facet values
+    # also yields the total, so count_documents is skipped.
+    facet_result = await load_product_facets(query, facet_key) if facet_key else None
+    total_products = facet_result["total"] if facet_result else None
+    facets = facet_result["facets"] if facet_result else None
+
+    if search and sort == 'relevance':
+        if filters:
+            matching = set(await db.products.distinct("id", query))
+            ranked_ids = [product_id for product_id in ranked_ids if product_id in matching]
+        # Ranking lives in the index, so page over it directly and only
+        # fetch the documents for this page.
+        total_products = len(ranked_ids)
+        page_ids = ranked_ids[skip:skip + limit]
+        docs = await db.products.find({"id": {"$in": page_ids}}, projection).to_list(limit)
+        if projection is PRODUCT_PROJECTION:  # full documents go out unvalidated
+            docs = [fill_product_defaults(doc) for doc in docs]
+        docs_by_id = {doc["id"]: doc for doc in docs}
+        return {
+            "products": [docs_by_id[pid] for pid in page_ids if pid in docs_by_id],
+            "total_products": total_products,
+            "total_pages": math.ceil(total_products / limit),
+            "current_page": page,
+            "facets": facets
+        }
+
+    sort_field, sort_direction = PRODUCT_SORTS[sort]
+    if total_products is None:
+        total_products = await db.products.count_documents(query)
     total_pages = math.ceil(total_products / limit)
-    skip = (page - 1) * limit
-    products = await db.products.find(query, {"_id": 0}).sort(sort_criteria).skip(skip).limit(limit).to_list(limit)
+
+    if cursor:
+        # Keyset mode: seek past the cursor's (sort key, id) instead of skipping.
+        # One extra document tells us whether another page exists.
+        position = decode_product_cursor(cursor, sort)
+        page = position["p"]
+        backwards = position["d"] == "prev"
+        direction = -sort_direction if backwards else sort_direction
+        seek = keyset_filter(sort_field, direction, position["v"], position["id"])
+        products = await db.products.find(
+            {"$and": [query, seek]} if query else seek, projection
+        ).sort([(sort_field, direction), ("id", direction)]).limit(limit + 1).to_list(limit + 1)
+        has_more = len(products) > limit
+        products = products[:limit]
+        if backwards:
+            products.reverse()
+            has_prev, has_next = has_more, True
+        else:
+            has_prev, has_next = True, has_more
+    else:
+        sort_criteria = [(sort_field, sort_direction), ("id", sort_direction)]
+        products = await db.products.find(query, projection).sort(sort_criteria).skip(skip).limit(limit).to_list(limit)
+        has_prev, has_next = page > 1, skip + len(products) < total_products
+    if projection is PRODUCT_PROJECTION:  # full documents go out unvalidated
+        products = [fill_product_defaults(doc) for doc in products]
+
     return {
         "products": products,
         "total_products": total_products,
         "total_pages": total_pages,
-        "current_page": page
+        "current_page": page,
+        "next_cursor": encode_product_cursor(sort, products[-1], "next", page + 1) if products and has_next else None,
+        "prev_cursor": encode_product_cursor(sort, products[0], "prev", page - 1) if products and has_prev else None,
+        "facets": facets
     }
 
-@api_router.get("/products/featured", response_model=List[Product])
-async def get_featured_products():
-    products = await db.products.find({"featured": True}, {"_id": 0}).to_list(100)
+async def load_featured_products(refresh: bool = False) -> List[dict]:
+    """
+    refresh=True bypasses product_cache: featured_version and catalog_version are
+    polled independently, so a rebuild for a new featured_version may run before
+    this worker has seen the catalog bump that would have cleared the cache.
+    """
+    await catalog_version.current()
+    products = None if refresh else product_cache.get_featured()
+    if products is None:
+        products = [
+            fill_product_defaults(doc) for doc in await db.products.find({"featured": True}, PRODUCT_PROJECTION).to_list(100)
+        ]
+        product_cache.put_featured(products)
     return products
 
-# NEW ENDPOINT: Get recommendations (Simulated)
+@api_router.get("/products/featured", response_model=List[Product])
+async def get_featured_products(request: Request):
+    return await serve_static_payload(
+        request, "featured", featured_version, functools.partial(load_featured_products, refresh=True), CATALOG_CACHE_CONTROL
+    )
+
+# "Customers Also Bought": co-purchase neighbours, topped up with featured
+# products for items nobody has bought alongside anything yet.
 @api_router.get("/products/recommendations/{product_id}", response_model=List[Product])
 async def get_product_recommendations(product_id: str):
-    # This simulates "Customers Also Bought" by returning up to 4 other featured products
-    # excluding the current product ID.
-    recommendations = await db.products.find(
-        {"featured": True, "id": {"$ne": product_id}}, 
-        {"_id": 0}
-    ).limit(4).to_list(4)
+    await co_purchase_recommender.ensure_built()
+    await catalog_version.current()
+    recommended_ids = co_purchase_recommender.recommend(product_id)[:4]
+    docs = {pid: doc for pid in recommended_ids if (doc := product_cache.get(pid))}
+    missing = [pid for pid in recommended_ids if pid not in docs]
+    if missing:
+        for doc in await db.products.find({"id": {"$in": missing}}, {"_id": 0}).to_list(len(missing)):
+            product_cache.put(doc)
+            docs[doc['id']] = doc
+    # Deleted products can linger in the matrix until the next rebuild.
+    recommendations = [docs[pid] for pid in recommended_ids if pid in docs]
+    if len(recommendations) < 4:
+        seen = {product_id, *docs}
+        featured = await load_featured_products()
+        recommendations += [p for p in featured if p['id'] not in seen][:4 - len(recommendations)]
     return recommendations
 
 
 @api_router.get("/products/{slug_or_id}", response_model=Product)
-async def get_product(slug_or_id: str):
-    # Try finding by ID (UUID) for existing links first
-    product = await db.products.find_one({"id": slug_or_id}, {"_id": 0})
-    if not product:
-        # Then try finding by the new slug
-        product = await db.products.find_one({"slug": slug_or_id}, {"_id": 0})
-        if not product:
-            raise HTTPException(status_code=404, detail="Product not found")
+async def get_product(slug_or_id: str, request: Request, response: Response):
+    # Also clears the product cache if another worker changed the catalog
+    etag = make_etag("product", await catalog_version.current(), slug_or_id)
+    if not_modified := conditional_response(request, response, etag, CATALOG_CACHE_CONTROL):
+        return not_modified
+    product = product_cache.get(slug_or_id)
+    if product:
+        return product
+    # One query for all three; id (old links) wins over a current slug, which
+    # wins over a retired one, so a rename never shadows another product's live slug.
+    candidates = await db.products.find(
+        {"$or": [{"id": slug_or_id}, {"slug": slug_or_id}, {"previous_slugs": slug_or_id}]}, {"_id": 0}
+    ).to_list(None)
+    if not candidates:
+        raise HTTPException(status_code=404, detail="Product not found")
+    product = min(candidates, key=lambda p: 0 if p['id'] == slug_or_id else 1 if p.get('slug') == slug_or_id else 2)
+    retired = product['id'] != slug_or_id and product.get('slug') != slug_or_id
+    product_cache.put(product, retired_slug=slug_or_id if retired else None)
     return product
 
 @api_router.put("/products/{product_id}", response_model=Product)
@@ -631,20 +2772,29 @@ async def update_product(product_id: str, product: ProductCreate, user: dict = D
     
     update_data = product.model_dump()
     update_data['slug'] = generate_slug(update_data['name']) # Re-generate slug on update
+    # Keep the old slug resolvable so shared links survive a rename
+    previous_slugs = existing.get('previous_slugs', []) + [existing.get('slug')]
+    update_data['previous_slugs'] = [s for s in dict.fromkeys(previous_slugs) if s and s != update_data['slug']]
     
     await db.products.update_one({"id": product_id}, {"$set": update_data})
     updated_product = await db.products.find_one({"id": product_id}, {"_id": 0})
+    product_search_index.add(updated_product)
+    await bump_catalog_version(
+        [product_id], featured=existing.get('featured', False) or updated_product.get('featured', False)
+    )
     return updated_product
 
 @api_router.delete("/products/{product_id}")
 async def delete_product(product_id: str, user: dict = Depends(verify_admin)): 
-    result = await db.products.delete_one({"id": product_id})
-    if result.deleted_count == 0:
+    deleted = await db.products.find_one_and_delete({"id": product_id}, {"featured": 1})
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Product not found")
+    product_search_index.remove(product_id)
+    await bump_catalog_version([product_id], featured=deleted.get('featured', False))
     return {"message": "Product deleted successfully"}
 
 # --- Review Routes ---
-@api_router.post("/reviews", response_model=Review) # RATE LIMIT REMOVED
+@api_router.post("/reviews", response_model=Review, dependencies=[Depends(rate_limited("reviews"))])
 async def create_review(review: ReviewCreate, user: dict = Depends(get_current_user)): 
     review_obj = Review(
         **review.model_dump(),
@@ -661,7 +2811,7 @@ async def get_product_reviews(product_id: str):
     return reviews
 
 # --- Order Routes ---
-@api_router.post("/orders/create-razorpay-order")
+@api_router.post("/orders/create-razorpay-order", dependencies=[Depends(rate_limited("checkout"))])
 async def create_razorpay_order(order_data: OrderCreate, user: dict = Depends(get_current_user)): 
     
     total_amount = order_data.total_amount
@@ -696,11 +2846,12 @@ async def create_razorpay_order(order_data: OrderCreate, user: dict = Depends(ge
     
     # Razorpay amount must be in paise (final_amount)
     try:
-        razorpay_order = razorpay_client.order.create({
-            "amount": int(final_amount * 100),
-            "currency": "INR",
-            "payment_capture": 1
-        })
+        with track_external("razorpay", "order.create"):
+            razorpay_order = get_razorpay_client().order.create({
+                "amount": int(final_amount * 100),
+                "currency": "INR",
+                "payment_capture": 1
+            })
     except Exception as e:
         logger.error(f"Razorpay order creation failed for user {user['_id']}: {e}")
         raise HTTPException(status_code=500, detail="Failed to create payment order. Check Razorpay keys.")
@@ -717,20 +2868,23 @@ async def create_razorpay_order(order_data: OrderCreate, user: dict = Depends(ge
         "currency": razorpay_order['currency'] 
     }
 
-@api_router.post("/orders/verify-payment")
+@api_router.post("/orders/verify-payment", dependencies=[Depends(rate_limited("checkout"))])
 async def verify_payment(payment: PaymentVerification, user: dict = Depends(get_current_user)): 
     try:
-        razorpay_client.utility.verify_payment_signature({
-            'razorpay_order_id': payment.razorpay_order_id,
-            'razorpay_payment_id': payment.razorpay_payment_id,
-            'razorpay_signature': payment.razorpay_signature
-        })
+        with track_external("razorpay", "verify_payment_signature"):
+            get_razorpay_client().utility.verify_payment_signature({
+                'razorpay_order_id': payment.razorpay_order_id,
+                'razorpay_payment_id': payment.razorpay_payment_id,
+                'razorpay_signature': payment.razorpay_signature
+            })
         
         now_iso = datetime.now(timezone.utc).isoformat()
         
         # FIX: Change status to 'processing' (not 'delivered') after successful payment
-        await db.orders.update_one(
-            {"id": payment.order_id},
+        # Only an unpaid order moves, so a repeated verify can't take stock or
+        # record the basket twice. (Abandoned orders may still be paid late.)
+        paid = await db.orders.update_one(
+            {"id": payment.order_id, "status": {"$in": ["pending", "abandoned"]}},
             {"$set": {
                 "payment_id": payment.razorpay_payment_id,
                 "status": "processing", # Correct initial status after payment
@@ -738,7 +2892,7 @@ async def verify_payment(payment: PaymentVerification, user: dict = Depends(get_
             }}
         )
         
-        order = await db.orders.find_one({"id": payment.order_id})
+        order = await db.orders.find_one({"id": payment.order_id}) if paid.modified_count else None
         if order:
             # Update inventory stock
             for item in order['items']:
@@ -752,6 +2906,8 @@ async def verify_payment(payment: PaymentVerification, user: dict = Depends(get_
                         {"id": item['product_id']},
                         {"$set": {"variants": product['variants']}}
                     )
+            await bump_catalog_version([item['product_id'] for item in order['items']])
+            co_purchase_recommender.record_basket(item['product_id'] for item in order['items'])
                     
         return {"success": True, "message": "Payment verified successfully, order is now processing."}
     except Exception as e:
@@ -760,15 +2916,15 @@ async def verify_payment(payment: PaymentVerification, user: dict = Depends(get_
 
 @api_router.get("/orders/my-orders", response_model=List[Order])
 async def get_my_orders(user: dict = Depends(get_current_user)): 
-    orders = await db.orders.find({"user_id": user['_id']}, {"_id": 0}).to_list(1000)
+    orders = await db.orders.find({"user_id": user['_id']}, ORDER_PROJECTION).to_list(1000)
     orders.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-    return orders
+    return trusted_json_response([fill_order_defaults(order) for order in orders])
 
 # ADDED ENDPOINT: Fixes 404 for AdminOrders.js (GET /api/orders)
 @api_router.get("/orders", response_model=List[Order])
 async def get_all_orders(user: dict = Depends(verify_admin)): 
-    orders = await db.orders.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return orders
+    orders = await db.orders.find({}, ORDER_PROJECTION).sort("created_at", -1).to_list(1000)
+    return trusted_json_response([fill_order_defaults(order) for order in orders])
 
 @api_router.post("/orders/{order_id}/request-return")
 async def request_return_or_replacement(
@@ -879,6 +3035,7 @@ async def process_admin_return_action(order_id: str, action_data: AdminReturnAct
                     {"id": item['product_id']},
                     {"$set": {"variants": product['variants']}}
                 )
+        await bump_catalog_version([item['product_id'] for item in order['items']])
         message = f"Return for order {order_id} approved. Inventory restocked. Initiate refund."
 
     elif action_data.action in ['approve_exchange', 'refund_unavailable']:
@@ -913,6 +3070,7 @@ async def process_admin_return_action(order_id: str, action_data: AdminReturnAct
         
         if product:
             await db.products.update_one({"id": product_id}, {"$set": {"variants": product['variants']}})
+            await bump_catalog_version([product_id])
 
 
         if action_data.action == 'refund_unavailable' or not is_available:
@@ -1038,9 +3196,30 @@ async def get_user_analytics(user: dict = Depends(verify_admin)):
         })
         
     user_analytics.sort(key=lambda x: x['total_spent'], reverse=True)
-    
+
     return user_analytics
 
+# --- Admin Token Revocation Endpoint ---
+@api_router.post("/admin/users/{user_id}/revoke-tokens")
+async def revoke_user_tokens(user_id: str, user: dict = Depends(verify_admin)):
+    """Invalidates every token issued to the user so far; they must log in again."""
+    updated = await db.users.find_one_and_update(
+        {"_id": user_id},
+        {"$inc": {"token_version": 1}},
+        projection={"token_version": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated:
+        raise HTTPException(status_code=404, detail="User not found")
+    token_revocations.revoke(user_id, updated["token_version"])
+    user_principal_cache.delete(user_id)
+    return {
+        "message": "Tokens revoked.",
+        "token_version": updated["token_version"],
+        # Other workers pick the revocation up at their next refresh.
+        "effective_everywhere_within_seconds": TOKEN_REVOCATION_REFRESH_SECONDS
+    }
+
 
 # ADDED ENDPOINT: Required for the Returns tab in AdminCustomers.js
 @api_router.get("/admin/returns")
@@ -1120,7 +3299,10 @@ async def get_inventory_analytics(user: dict = Depends(verify_admin)):
 
 # --- Landing Page Routes ---
 @api_router.get("/landing-page")
-async def get_landing_page_settings():
+async def get_landing_page_settings(request: Request):
+    return await serve_static_payload(request, "landing", landing_page_version, load_landing_page_settings, SETTINGS_CACHE_CONTROL)
+
+async def load_landing_page_settings():
     settings = await db.landing_page.find_one({"id": "landing_page"}, {"_id": 0})
     if not settings:
         default_settings = LandingPageSettings()
@@ -1136,23 +3318,29 @@ async def update_landing_page_settings(settings: LandingPageUpdate, user: dict =
         {"$set": update_data},
         upsert=True
     )
+    await landing_page_version.bump()
     updated_settings = await db.landing_page.find_one({"id": "landing_page"}, {"_id": 0})
     return updated_settings
 
 # --- Cloudinary Signature Route ---
 @api_router.get("/upload-signature", response_model=UploadSignature)
+@skip_compression # Never compress responses carrying secrets (BREACH)
 async def get_upload_signature(user: dict = Depends(verify_admin)):
     timestamp = int(time.time())
-    signature = cloudinary.utils.api_sign_request(
-        {"timestamp": timestamp},
-        os.environ.get('CLOUDINARY_API_SECRET')
-    )
+    with track_external("cloudinary", "api_sign_request"):
+        signature = get_cloudinary().utils.api_sign_request(
+            {"timestamp": timestamp},
+            os.environ.get('CLOUDINARY_API_SECRET')
+        )
     return {"timestamp": timestamp, "signature": signature}
 
 # --- User Profile Endpoints ---
 @api_router.get("/profile", response_model=UserProfile)
 async def get_user_profile(user: dict = Depends(get_current_user)):
-    return user
+    profile = await db.users.find_one({"_id": user['_id']}, USER_PROFILE_PROJECTION)
+    if not profile:
+        raise HTTPException(status_code=404, detail="User not found")
+    return profile
 
 @api_router.put("/profile", response_model=UserProfile)
 async def update_user_profile(profile_data: UserProfileUpdate, user: dict = Depends(get_current_user)):
@@ -1166,11 +3354,13 @@ async def update_user_profile(profile_data: UserProfileUpdate, user: dict = Depe
     if not update_fields:
         raise HTTPException(status_code=400, detail="No valid fields to update")
 
-    await db.users.update_one(
+    updated_profile = await db.users.find_one_and_update(
         {"_id": user_id},
-        {"$set": update_fields}
+        {"$set": update_fields},
+        projection=USER_PROFILE_PROJECTION,
+        return_document=ReturnDocument.AFTER
     )
-    updated_profile = await db.users.find_one({"_id": user_id})
+    user_principal_cache.delete(user_id)
     if not updated_profile:
         raise HTTPException(status_code=404, detail="User profile not found after update")
     return updated_profile
@@ -1181,24 +3371,26 @@ async def add_to_wishlist(data: WishlistUpdate, user: dict = Depends(get_current
     user_id = user['_id']
     product_id = data.product_id
     
-    await db.users.update_one(
+    updated_profile = await db.users.find_one_and_update(
         {"_id": user_id},
-        {"$addToSet": {"wishlist": product_id}}
+        {"$addToSet": {"wishlist": product_id}},
+        projection=USER_PROFILE_PROJECTION,
+        return_document=ReturnDocument.AFTER
     )
-    
-    updated_profile = await db.users.find_one({"_id": user_id})
+    user_principal_cache.delete(user_id)
     return updated_profile
 
 @api_router.delete("/profile/wishlist/{product_id}", response_model=UserProfile)
 async def remove_from_wishlist(product_id: str, user: dict = Depends(get_current_user)):
     user_id = user['_id']
     
-    await db.users.update_one(
+    updated_profile = await db.users.find_one_and_update(
         {"_id": user_id},
-        {"$pull": {"wishlist": product_id}}
+        {"$pull": {"wishlist": product_id}},
+        projection=USER_PROFILE_PROJECTION,
+        return_document=ReturnDocument.AFTER
     )
-    
-    updated_profile = await db.users.find_one({"_id": user_id})
+    user_principal_cache.delete(user_id)
     return updated_profile
 
 # --- Admin Cleanup Endpoint ---
@@ -1216,16 +3408,110 @@ async def cleanup_collections(cleanup_data: CleanupRequest, user: dict = Depends
         try:
             result = await db[collection_name].delete_many({})
             results[collection_name] = f"Success: Deleted {result.deleted_count} documents."
+            if collection_name == "products":
+                product_search_index.invalidate()
+                product_cache.clear()
+                await bump_catalog_version(featured=True)
+            elif collection_name == "orders":
+                co_purchase_recommender.invalidate()
         except Exception as e:
             results[collection_name] = f"Failure: {str(e)}"
             
     return {"message": "Cleanup complete.", "details": results}
 
+# --- Admin Compression Stats Endpoint ---
+@api_router.get("/admin/compression-stats")
+async def get_compression_stats(user: dict = Depends(verify_admin)):
+    compression_stats: Dict[str, Dict[str, float]] = {}
+    for metric in metrics_registry().collect():
+        for sample in metric.samples:
+            if sample.name == "http_compression_bytes_total":
+                field = f'bytes_{sample.labels["stage"]}'
+            elif sample.name == "http_compression_duration_seconds_count":
+                field = "responses"
+            elif sample.name == "http_compression_duration_seconds_sum":
+                field = "seconds"
+            else:
+                continue
+            stats = compression_stats.setdefault(
+                sample.labels["encoding"], {"responses": 0, "bytes_in": 0, "bytes_out": 0, "seconds": 0.0}
+            )
+            stats[field] += sample.value if field == "seconds" else int(sample.value)
+    return {
+        encoding: {
+            **stats,
+            "ratio": round(stats["bytes_out"] / stats["bytes_in"], 4) if stats["bytes_in"] else None,
+            "avg_ms": round(stats["seconds"] * 1000 / stats["responses"], 3) if stats["responses"] else None
+        }
+        for encoding, stats in compression_stats.items()
+    }
+
+# --- Admin Slow Query Endpoint ---
+@api_router.get("/admin/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(20, ge=1, le=SLOW_QUERY_MAX_SHAPES),
+    sort: str = Query("total_ms", pattern="^(total_ms|max_ms|avg_ms|count)$"),
+    user: dict = Depends(verify_admin)
+):
+    return {
+        "threshold_ms": slow_query_log.threshold_ms,
+        "window_seconds": slow_query_log.window_seconds,
+        "shapes": slow_query_log.top(limit, sort)
+    }
+
+# --- Admin Pool Stats Endpoint ---
+@api_router.get("/admin/pool-stats")
+async def get_pool_stats(user: dict = Depends(verify_admin)):
+    pool_options = client.options.pool_options
+    return {
+        "config": {
+            "max_pool_size": pool_options.max_pool_size,
+            "min_pool_size": pool_options.min_pool_size,
+            "max_idle_time_seconds": pool_options.max_idle_time_seconds,
+            "wait_queue_timeout_seconds": pool_options.wait_queue_timeout,
+            "server_selection_timeout_seconds": client.options.server_selection_timeout,
+            "compressors": [c for c in mongo_client_options.get("compressors", "").split(",") if c]
+        },
+        "pools": mongo_pool_listener.stats()
+    }
+
+# --- Admin Cache Stats Endpoint ---
+@api_router.get("/admin/cache-stats")
+async def get_cache_stats(user: dict = Depends(verify_admin)):
+    return {
+        "catalog_version": await catalog_version.current(),
+        "caches": {name: cache.stats() for name, cache in CACHE_REGISTRY.items()}
+    }
+
+# --- Prometheus Metrics Endpoint ---
+def metrics_registry() -> CollectorRegistry:
+    """Every worker's metrics under gunicorn (PROMETHEUS_MULTIPROC_DIR), else this process's."""
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    registry = metrics_registry()
+    if registry is not REGISTRY:
+        registry.register(CacheStatsCollector())  # cache stats are per worker
+    return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
 # --- Health check ---
 @api_router.get("/")
 async def root():
     return {"message": "Fifth Beryl API is running"}
 
+# Compress large responses. Added before CORS so CORS stays the outermost layer.
+app.add_middleware(CompressionMiddleware)
+
+# Record request metrics around compression, inside CORS.
+app.add_middleware(MetricsMiddleware)
+
 # Add the CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -1241,6 +3527,9 @@ app.include_router(auth_router)
 app.include_router(coupon_router)
 app.include_router(ticker_router) 
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()    
\ No newline at end of file
+ROUTER_PREFIXES[:] = sorted(
+    [(api_router.prefix, "api_router"), (auth_router.prefix, "auth_router"),
+     (coupon_router.prefix, "coupon_router"), (ticker_router.prefix, "ticker_router")],
+    key=lambda entry: len(entry[0]), reverse=True
+)
+    
\ No newline at end of file
@@ -0,0 +1,70 @@
+# backend/bench/bench_compression.py
+"""
+Measures gzip levels and brotli qualities on admin-sized JSON payloads, to
+pick the defaults used by CompressionMiddleware (GZIP_LEVEL, BROTLI_QUALITY).
+
+For each setting it reports the compression ratio, CPU time, and the time
+the saved bytes would have taken on the wire at --mbps. A level is worth it
+while the transfer time saved exceeds the CPU spent.
+
+    python bench/bench_compression.py
+    python bench/bench_compression.py --items 5000 --mbps 20
+"""
+import argparse
+import gzip
+import time
+
+import orjson
+
+from bench_serialization import make_order, make_product
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def measure(fn, min_seconds: float = 0.3) -> float:
+    fn()
+    runs, started = 0, time.perf_counter()
+    while True:
+        fn()
+        runs += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            return elapsed / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--mbps", type=float, default=10.0, help="client bandwidth in megabits/s")
+    args = parser.parse_args()
+
+    payloads = {
+        "orders": orjson.dumps([make_order(i) for i in range(args.items)]),
+        "products": orjson.dumps([make_product(i) for i in range(args.items)]),
+    }
+    settings = [("gzip", level) for level in (1, 3, 5, 6, 9)]
+    if brotli is not None:
+        settings += [("br", quality) for quality in (1, 4, 5, 6, 9, 11)]
+
+    bytes_per_ms = args.mbps * 1_000_000 / 8 / 1000
+    print(f"{'payload':<10}{'codec':>6}{'level':>6}{'KiB in':>9}{'KiB out':>9}{'ratio':>8}{'cpu ms':>9}{'wire ms saved':>15}")
+    for name, body in payloads.items():
+        for codec, level in settings:
+            if codec == "gzip":
+                compress = lambda: gzip.compress(body, compresslevel=level)  # noqa: E731
+            else:
+                compress = lambda: brotli.compress(body, quality=level)  # noqa: E731
+            out = compress()
+            cpu_ms = measure(compress) * 1000
+            saved_ms = (len(body) - len(out)) / bytes_per_ms
+            print(
+                f"{name:<10}{codec:>6}{level:>6}{len(body) / 1024:>9.0f}{len(out) / 1024:>9.0f}"
+                f"{len(out) / len(body):>8.3f}{cpu_ms:>9.2f}{saved_ms:>15.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+# backend/bench/bench_helpers.py
+"""
+Microbenchmarks for the per-request CPU work in server.py: slugs, coupon
+maths, JWTs, request authentication, password hashing and model
+construction/serialization.
+
+Each benchmark is calibrated to run for roughly --round-time seconds per
+round and repeated for --rounds rounds; min/median/mean/stddev are reported
+per call, in the style of pytest-benchmark. Every run is appended to a JSON
+Lines history file and compared with the previous run from the same machine,
+so per-request CPU regressions show up as a slower median:
+
+    python bench/bench_helpers.py                       # run all, append history
+    python bench/bench_helpers.py -k token model_dump   # substring filter
+    python bench/bench_helpers.py --fail-on-regression  # exit 1 if a median got >20% slower
+    python bench/bench_helpers.py --no-save             # don't touch the history
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "api"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")  # client connects lazily
+
+import server  # noqa: E402
+from fastapi.security import HTTPAuthorizationCredentials  # noqa: E402
+from bench_serialization import make_order, make_product  # noqa: E402
+
+DEFAULT_HISTORY = Path(__file__).resolve().parent / "results" / "microbench-history.jsonl"
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    """Registers a factory returning the zero-argument callable to time."""
+    def register(factory):
+        BENCHMARKS[name] = factory
+        return factory
+    return register
+
+
+def run_sync(coro):
+    """Drives a coroutine that never suspends (its I/O is stubbed) without an event loop."""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coro.close()
+    raise RuntimeError("benchmarked coroutine awaited real I/O")
+
+
+# --- Helpers ---
+
+@benchmark("generate_slug")
+def bench_generate_slug():
+    return lambda: server.generate_slug("Men's Classic Oxford Shirt -- Slim Fit (Blue/White)")
+
+
+class StubCollection:
+    def __init__(self, doc, key="code"):
+        self.doc = doc
+        self.key = key
+
+    async def find_one(self, query, *args, **kwargs):
+        return dict(self.doc) if query.get(self.key) == self.doc[self.key] else None
+
+
+@benchmark("apply_coupon_discount")
+def bench_apply_coupon_discount():
+    coupon = {
+        "id": str(uuid.uuid4()), "code": "SAVE10", "discount_type": "percentage", "discount_value": 10.0,
+        "min_purchase": 999.0, "expiry_date": "2099-12-31T23:59:59+00:00", "is_active": True,
+    }
+    server.db = SimpleNamespace(coupons=StubCollection(coupon))
+    return lambda: run_sync(server.apply_coupon_discount(2598.0, "save10"))
+
+
+# --- Auth ---
+
+@benchmark("create_access_token")
+def bench_create_access_token():
+    return lambda: server.create_access_token({"sub": str(uuid.uuid4())})
+
+
+@benchmark("jwt.decode")
+def bench_jwt_decode():
+    token = server.create_access_token({"sub": str(uuid.uuid4())})
+    from jose import jwt
+    return lambda: jwt.decode(token, server.SECRET_KEY, algorithms=[server.ALGORITHM])
+
+
+def auth_request():
+    """A bearer token for a stubbed user, and a call that authenticates it like a request would."""
+    user = {"_id": str(uuid.uuid4()), "email": "shopper@example.com", "name": "Shopper"}
+    server.db = SimpleNamespace(users=StubCollection(user, key="_id"))
+    token = server.create_access_token(server.token_claims(user))
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    return lambda: run_sync(server.get_current_user(credentials))
+
+
+# Per-request auth CPU: the principal is cached in both, so the difference is
+# the decoded-token cache (jwt.decode vs a SHA-256 digest and an LRU lookup).
+@benchmark("get_current_user(token uncached)")
+def bench_get_current_user_uncached():
+    authenticate = auth_request()
+
+    def call():
+        server.token_cache.clear()
+        return authenticate()
+    return call
+
+
+@benchmark("get_current_user(token cached)")
+def bench_get_current_user_cached():
+    return auth_request()
+
+
+@benchmark("hash_password")
+def bench_hash_password():
+    return lambda: server.hash_password("correct horse battery staple")
+
+
+@benchmark("verify_password")
+def bench_verify_password():
+    hashed = server.hash_password("correct horse battery staple")
+    return lambda: server.verify_password("correct horse battery staple", hashed)
+
+
+# --- Models ---
+
+def order_with_items(n: int) -> dict:
+    order = make_order(0)
+    item = order["items"][0]
+    order["items"] = [{**item, "product_id": str(uuid.uuid4())} for _ in range(n)]
+    return order
+
+
+for _n in (1, 10, 100):
+    @benchmark(f"Order({_n} items)")
+    def bench_order_construct(n=_n):
+        doc = order_with_items(n)
+        return lambda: server.Order(**doc)
+
+    @benchmark(f"Order({_n} items).model_dump")
+    def bench_order_dump(n=_n):
+        order = server.Order(**order_with_items(n))
+        return order.model_dump
+
+
+def product_with_variants(n: int) -> dict:
+    product = make_product(0)
+    product["variants"] = [
+        {"color": f"Color {i}", "color_code": f"#{i:06x}", "sizes": {"S": 3, "M": 5, "L": 4, "XL": 2, "XXL": 1}}
+        for i in range(n)
+    ]
+    return product
+
+
+for _n in (3, 30):
+    @benchmark(f"Product({_n} variants)")
+    def bench_product_construct(n=_n):
+        doc = product_with_variants(n)
+        return lambda: server.Product(**doc)
+
+    @benchmark(f"Product({_n} variants).model_dump")
+    def bench_product_dump(n=_n):
+        product = server.Product(**product_with_variants(n))
+        return product.model_dump
+
+
+# --- Runner ---
+
+def calibrate(fn, round_time: float) -> int:
+    """Iterations per round so that one round takes about round_time seconds."""
+    iterations = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= round_time / 4 or iterations >= 1_000_000:
+            return max(1, int(iterations * round_time / max(elapsed, 1e-9)))
+        iterations *= 10
+
+
+def run_benchmark(fn, rounds: int, round_time: float) -> dict:
+    fn()  # warm up
+    iterations = calibrate(fn, round_time)
+    per_call = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        per_call.append((time.perf_counter() - started) / iterations)
+    return {
+        "min_us": min(per_call) * 1e6,
+        "median_us": statistics.median(per_call) * 1e6,
+        "mean_us": statistics.fmean(per_call) * 1e6,
+        "stddev_us": statistics.stdev(per_call) * 1e6 if rounds > 1 else 0.0,
+        "ops": 1 / statistics.median(per_call),
+        "rounds": rounds,
+        "iterations": iterations,
+    }
+
+
+def machine_id() -> str:
+    return f"{platform.node()}/{platform.machine()}/py{platform.python_version()}"
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def previous_run(history: Path):
+    if not history.exists():
+        return None
+    for line in reversed(history.read_text().splitlines()):
+        if line.strip():
+            run = json.loads(line)
+            if run["meta"]["machine"] == machine_id():
+                return run
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", nargs="+", default=[], help="only run benchmarks whose name contains one of these")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--round-time", type=float, default=0.2, help="target seconds per round")
+    parser.add_argument("--history", type=Path, default=DEFAULT_HISTORY)
+    parser.add_argument("--threshold", type=float, default=0.20, help="median slowdown counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    selected = {name: factory for name, factory in BENCHMARKS.items() if not args.k or any(k in name for k in args.k)}
+    baseline = previous_run(args.history)
+    previous = baseline["results"] if baseline else {}
+
+    print(f"{'benchmark':<36}{'min us':>11}{'median us':>11}{'mean us':>11}{'stddev':>10}{'ops/s':>12}{'vs prev':>10}")
+    results, regressions = {}, []
+    for name, factory in selected.items():
+        result = results[name] = run_benchmark(factory(), args.rounds, args.round_time)
+        change = ""
+        if name in previous:
+            delta = result["median_us"] / previous[name]["median_us"] - 1
+            change = f"{delta:+.1%}"
+            if delta > args.threshold:
+                regressions.append(name)
+                change += " !"
+        print(
+            f"{name:<36}{result['min_us']:>11.2f}{result['median_us']:>11.2f}{result['mean_us']:>11.2f}"
+            f"{result['stddev_us']:>10.2f}{result['ops']:>12.0f}{change:>10}"
+        )
+
+    if baseline:
+        print(f"\ncompared with {baseline['meta']['git_commit']} ({baseline['meta']['created_at']})")
+    if not args.no_save:
+        args.history.parent.mkdir(parents=True, exist_ok=True)
+        run = {
+            "meta": {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "git_commit": git_commit(), "machine": machine_id()},
+            "results": results,
+        }
+        with args.history.open("a") as history:
+            history.write(json.dumps(run) + "\n")
+    if regressions:
+        print(f"regressions (> {args.threshold:.0%} slower median): {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
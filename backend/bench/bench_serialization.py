@@ -0,0 +1,136 @@
+# backend/bench/bench_serialization.py
+"""
+Compares the two response paths for the hot read routes:
+
+  validated: FastAPI's default -- validate the payload against the route's
+             response_model, then encode with the stdlib json encoder.
+  trusted:   trusted_json_response() -- hand the DB documents to orjson as-is.
+
+Runs against synthetic documents shaped like production data, so no database
+is needed:
+
+    python bench/bench_serialization.py            # 100 and 1000 items
+    python bench/bench_serialization.py --sizes 10 100 --json results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "api"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")  # client connects lazily
+
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+from fastapi.routing import APIRoute, serialize_response  # noqa: E402
+
+import server  # noqa: E402
+
+
+def make_product(i: int) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "name": f"Oxford Shirt {i}",
+        "description": "Breathable cotton oxford with a button-down collar. " * 4,
+        "mrp": 2499.0,
+        "price": 1299.0 + i % 50,
+        "slug": f"oxford-shirt-{i}",
+        "fit": "Slim Fit",
+        "images": [{"url": f"https://res.cloudinary.com/demo/image/upload/{i}_{n}.jpg", "alt": ""} for n in range(4)],
+        "variants": [
+            {"color": color, "color_code": "#1e3a8a", "sizes": {"S": 3, "M": 5, "L": 4, "XL": 2, "XXL": 1}}
+            for color in ("Blue", "White", "Black")
+        ],
+        "category": "shirts",
+        "featured": i % 5 == 0,
+        "created_at": "2025-01-01T00:00:00+00:00",
+    }
+
+
+def make_order(i: int) -> dict:
+    items = [
+        {"product_id": str(uuid.uuid4()), "product_name": f"Oxford Shirt {n}", "color": "Blue", "size": "M", "quantity": 1, "price": 1299.0}
+        for n in range(3)
+    ]
+    return server.fill_order_defaults({
+        "id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "user_email": f"customer{i}@example.com",
+        "items": items,
+        "shipping_address": {
+            "name": "Customer", "phone": "9999999999", "address_line1": "1 MG Road", "address_line2": "",
+            "city": "Bengaluru", "state": "KA", "postal_code": "560001", "country": "India",
+        },
+        "total_amount": 3897.0,
+        "discount_amount": 0.0,
+        "final_amount": 3897.0,
+        "status": "processing",
+        "created_at": "2025-01-01T00:00:00+00:00",
+        "updated_at": "2025-01-01T00:00:00+00:00",
+    })
+
+
+def route_field(path: str):
+    for route in server.app.routes:
+        if isinstance(route, APIRoute) and route.path == path and "GET" in route.methods:
+            return route.response_field
+    raise LookupError(path)
+
+
+def measure(fn, min_seconds: float = 0.5) -> float:
+    """Mean seconds per call over at least min_seconds of repetitions."""
+    fn()  # warm up
+    runs, started = 0, time.perf_counter()
+    while True:
+        fn()
+        runs += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            return elapsed / runs
+
+
+def bench(path: str, payload) -> dict:
+    field = route_field(path)
+    loop = asyncio.new_event_loop()
+
+    def validated():
+        content = loop.run_until_complete(serialize_response(field=field, response_content=payload))
+        return JSONResponse(content).body
+
+    def trusted():
+        return ORJSONResponse(payload).body
+
+    assert json.loads(validated()) == json.loads(trusted()), f"{path}: paths disagree"
+    validated_s, trusted_s = measure(validated), measure(trusted)
+    loop.close()
+    return {"validated_ms": validated_s * 1000, "trusted_ms": trusted_s * 1000, "speedup": validated_s / trusted_s, "bytes": len(trusted())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for n in args.sizes:
+        products = [make_product(i) for i in range(n)]
+        listing = {
+            "products": products, "total_products": n, "total_pages": 1, "current_page": 1,
+            "next_cursor": None, "prev_cursor": None, "facets": None,
+        }
+        results.append({"route": "/api/products", "items": n, **bench("/api/products", listing)})
+        results.append({"route": "/api/orders", "items": n, **bench("/api/orders", [make_order(i) for i in range(n)])})
+
+    print(f"{'route':<16}{'items':>7}{'validated ms':>15}{'trusted ms':>13}{'speedup':>10}{'KiB':>9}")
+    for r in results:
+        print(f"{r['route']:<16}{r['items']:>7}{r['validated_ms']:>15.2f}{r['trusted_ms']:>13.2f}{r['speedup']:>9.1f}x{r['bytes'] / 1024:>9.1f}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# backend/bench/bench_serving.py
+"""
+Compares serving configurations under the same load. For each configuration
+it starts the server as a separate process, waits for it to answer, runs
+loadtest.py against it with --url, sends SIGTERM and collects the results:
+
+  uvicorn-asyncio-h11     uvicorn, 1 process, stdlib asyncio loop + h11 parser
+  uvicorn-uvloop-httptools uvicorn, 1 process, uvloop + httptools
+  serve-1-worker          serve.py (gunicorn + ProductionUvicornWorker), 1 worker
+  serve-default           serve.py with its default worker count (one per CPU)
+
+Needs a local mongod, like loadtest.py. The database is seeded once, up front:
+
+    python bench/bench_serving.py
+    python bench/bench_serving.py --configs uvicorn-uvloop-httptools serve-default \\
+        --concurrency 100 --duration 30 --save bench/results/serving.json
+
+Reference results and their caveats: "Serving configurations" in bench/README.md.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BENCH_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = BENCH_DIR.parent
+PYTHON = sys.executable
+
+CONFIGS = {
+    "uvicorn-asyncio-h11": ["-m", "uvicorn", "server:app", "--app-dir", "api", "--loop", "asyncio", "--http", "h11"],
+    "uvicorn-uvloop-httptools": ["-m", "uvicorn", "server:app", "--app-dir", "api", "--loop", "uvloop", "--http", "httptools"],
+    "serve-1-worker": ["serve.py"],
+    "serve-default": ["serve.py"],
+}
+
+
+def start(name: str, args, log_path: Path) -> subprocess.Popen:
+    """Starts a configuration. Its output goes to log_path: an unread pipe would
+    fill up under load and block the server mid-run."""
+    env = {
+        **os.environ,
+        "MONGO_URL": args.mongo_url,
+        "DB_NAME": args.db,
+        "ADMIN_EMAIL": "loadtest-admin@example.com",
+        "RATE_LIMIT_ENABLED": "false",
+        "HOST": "127.0.0.1",
+        "PORT": str(args.port),
+    }
+    command = [PYTHON, *CONFIGS[name]]
+    if name.startswith("uvicorn"):
+        command += ["--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning", "--no-access-log"]
+    if name == "serve-1-worker":
+        env["WEB_CONCURRENCY"] = "1"
+    with open(log_path, "w") as log:
+        return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_ready(process: subprocess.Popen, url: str, log_path: Path, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with {process.returncode}:\n{log_path.read_text()[-2000:]}")
+        try:
+            if httpx.get(f"{url}/api/", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise TimeoutError(f"server at {url} did not become ready within {timeout:.0f}s")
+
+
+def loadtest(*extra) -> None:
+    subprocess.run([PYTHON, str(BENCH_DIR / "loadtest.py"), *extra], cwd=BACKEND_DIR, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("--scenarios", nargs="+", default=["browse", "login", "admin"])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--mongo-url", default=os.environ.get("LOADTEST_MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="fifth_beryl_loadtest")
+    parser.add_argument("--save", help="write all results to this JSON file")
+    args = parser.parse_args()
+
+    common = ["--mongo-url", args.mongo_url, "--db", args.db]
+    loadtest("--seed-only", *common)
+
+    url = f"http://127.0.0.1:{args.port}"
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        for name in args.configs:
+            print(f"\n=== {name} ===", file=sys.stderr)
+            log_path = Path(scratch) / f"{name}.log"
+            process = start(name, args, log_path)
+            try:
+                wait_ready(process, url, log_path)
+                output = Path(scratch) / f"{name}.json"
+                loadtest(
+                    "--url", url, *common, "--scenarios", *args.scenarios, "--concurrency", str(args.concurrency),
+                    "--duration", str(args.duration), "--warmup", str(args.warmup), "--save", str(output)
+                )
+                results[name] = json.loads(output.read_text())
+            finally:
+                process.terminate()  # SIGTERM: exercises the graceful drain as well
+                process.wait(timeout=60)
+
+    print(f"\n{'config':<28}{'scenario':<10}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for name, result in results.items():
+        for scenario, summary in result["scenarios"].items():
+            iteration = summary["iteration_ms"]
+            print(
+                f"{name:<28}{scenario:<10}{summary['requests_per_second']:>10.1f}{iteration['p50']:>9.1f}"
+                f"{iteration['p95']:>9.1f}{iteration['p99']:>9.1f}{summary['errors']:>8}"
+            )
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
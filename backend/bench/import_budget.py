@@ -0,0 +1,84 @@
+# backend/bench/import_budget.py
+"""
+Import-time budget for server.py. Cold starts on autoscaled workers pay for
+`import server` before the first request can be served, so this keeps it in
+check:
+
+  1. Imports server in fresh interpreters with `python -X importtime` and
+     takes the fastest of --runs; fails if it exceeds --budget-ms.
+  2. Fails if any module that server.py deliberately imports lazily (payment,
+     media, JWT/bcrypt, numeric libraries) was imported anyway.
+
+It prints the heaviest top-level imports so a regression is easy to place:
+
+    python bench/import_budget.py
+    python bench/import_budget.py --budget-ms 600 --runs 7 --top 15
+
+Exit status is 1 when either check fails, so it can run in CI.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parent.parent / "api"
+
+# Imported on first use inside server.py; importing any of them at module
+# level puts them back on the cold-start path.
+DEFERRED_MODULES = ("razorpay", "cloudinary", "jose", "passlib", "numpy", "scipy", "httpx", "requests")
+
+PROBE = "import sys, server; print(','.join(m for m in {modules!r} if m in sys.modules))"
+
+
+def measure_once() -> tuple:
+    """Returns (server cumulative ms, {top-level module: cumulative ms}, deferred modules that got imported)."""
+    env = {**os.environ, "MONGO_URL": os.environ.get("MONGO_URL", "mongodb://localhost:27017")}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(modules=DEFERRED_MODULES)],
+        cwd=API_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    total_ms, top_level = 0.0, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header row
+        ms = int(cumulative) / 1000
+        if name.strip() == "server":
+            total_ms = ms
+        elif name.startswith("   ") and not name.startswith("    "):
+            # Direct imports of server are indented one level (two spaces past the bar).
+            top_level[name.strip()] = ms
+    leaked = [m for m in result.stdout.strip().split(",") if m]
+    return total_ms, top_level, leaked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("IMPORT_BUDGET_MS", 1200)))
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters; the fastest run is compared")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [measure_once() for _ in range(args.runs)]
+    total_ms, top_level, leaked = min(runs, key=lambda run: run[0])
+
+    print(f"import server: {total_ms:.0f} ms (fastest of {args.runs}; budget {args.budget_ms:.0f} ms)")
+    print(f"\n{'heaviest direct imports':<40}{'ms':>8}")
+    for name, ms in sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{name:<40}{ms:>8.1f}")
+
+    failed = False
+    if total_ms > args.budget_ms:
+        print(f"\nFAIL: import time {total_ms:.0f} ms exceeds the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if leaked:
+        print(f"\nFAIL: modules meant to load lazily were imported: {', '.join(leaked)}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
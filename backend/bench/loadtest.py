@@ -0,0 +1,504 @@
+# backend/bench/loadtest.py
+"""
+End-to-end load test for the API. Seeds a scratch database on a local mongod,
+then drives the FastAPI app with scripted scenarios from concurrent virtual
+users and reports throughput and latency percentiles per scenario and route.
+
+Scenarios:
+  browse    anonymous storefront: landing page, ticker, featured, listing,
+            product page, reviews, recommendations
+  login     POST /api/auth/login, then the profile fetch the frontend makes
+  checkout  create-razorpay-order + verify-payment (Razorpay is stubbed)
+  admin     the admin dashboard: analytics, orders, customers, inventory
+  login-storm
+            browse alone, then browse again while --storm-users clients hammer
+            POST /api/auth/login; reports catalog latency for both phases.
+            A 429 from the password-hashing queue counts as shed load, not an
+            error. Not part of the default set.
+
+Transports:
+  asgi      in-process through httpx.ASGITransport -- measures the app only
+  uvicorn   a real uvicorn server on 127.0.0.1 in this process -- adds HTTP
+            parsing and the socket round trip
+  --url     an already running server (e.g. serve.py) started with
+            DB_NAME=<--db>, ADMIN_EMAIL=loadtest-admin@example.com and
+            RATE_LIMIT_ENABLED=false, seeded
+            beforehand with --seed-only. checkout is unavailable here because
+            Razorpay can only be stubbed in-process.
+
+    python bench/loadtest.py                                   # all scenarios, asgi
+    python bench/loadtest.py --transport uvicorn --concurrency 50 --duration 30
+    python bench/loadtest.py --scenarios browse checkout --save bench/results/baseline.json
+    python bench/loadtest.py --compare bench/results/baseline.json
+    python bench/loadtest.py --seed-only && python bench/loadtest.py --url http://127.0.0.1:8000
+    python bench/loadtest.py --transport uvicorn --scenarios login-storm --storm-users 100
+
+The database named by --db is dropped and re-seeded on every run; never point
+it at real data.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+
+API_DIR = Path(__file__).resolve().parent.parent / "api"
+sys.path.insert(0, str(API_DIR))
+
+ADMIN_EMAIL = "loadtest-admin@example.com"
+PASSWORD = "loadtest-password"
+PERCENTILES = (50, 90, 95, 99)
+
+
+# --- Stubs & seeding ---
+
+def stub_razorpay():
+    """Stands in for razorpay.Client: no network, every signature verifies."""
+    def create(data):
+        return {"id": f"order_{uuid.uuid4().hex[:14]}", "amount": data["amount"], "currency": data["currency"]}
+
+    return SimpleNamespace(
+        order=SimpleNamespace(create=create),
+        utility=SimpleNamespace(verify_payment_signature=lambda params: True),
+    )
+
+
+async def seed(server, args):
+    from bench_serialization import make_order, make_product
+
+    await server.client.drop_database(args.db)
+    db = server.db
+
+    products = [make_product(i) for i in range(args.products)]
+    await db.products.insert_many([dict(p) for p in products])
+
+    hashed = server.hash_password(PASSWORD)  # one bcrypt hash shared by every seeded account
+    users = [{"_id": "loadtest-admin", "email": ADMIN_EMAIL, "name": "Admin", "hashed_password": hashed, "wishlist": []}]
+    shoppers = [f"shopper{i}@example.com" for i in range(args.users)]
+    users += [
+        {"_id": f"shopper-{i}", "email": email, "name": f"Shopper {i}", "hashed_password": hashed,
+         "shipping_address": server.ShippingAddress().model_dump(), "wishlist": [], "created_at": "2025-01-01T00:00:00+00:00"}
+        for i, email in enumerate(shoppers)
+    ]
+    await db.users.insert_many(users)
+
+    statuses = ["pending", "processing", "shipped", "delivered", "cancelled"]
+    orders = []
+    for i in range(args.orders):
+        order = make_order(i)
+        basket = random.sample(products, k=min(3, len(products)))
+        order["user_id"] = f"shopper-{i % args.users}"
+        order["status"] = random.choice(statuses)
+        order["created_at"] = f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}T10:00:00+00:00"
+        for item, product in zip(order["items"], basket):
+            item["product_id"], item["product_name"] = product["id"], product["name"]
+        orders.append(order)
+    if orders:
+        await db.orders.insert_many(orders)
+
+    reviews = [
+        {"id": str(uuid.uuid4()), "product_id": p["id"], "user_id": "shopper-0", "user_name": "Shopper 0",
+         "rating": 1 + n % 5, "comment": "Fits well.", "created_at": "2025-01-01T00:00:00+00:00"}
+        for p in products[:100] for n in range(3)
+    ]
+    if reviews:
+        await db.reviews.insert_many(reviews)
+
+
+async def load_context(server) -> SimpleNamespace:
+    """Reads back what seed() wrote, so --url runs can reuse a database seeded earlier."""
+    products = await server.db.products.find({}, {"_id": 0}).to_list(None)
+    shoppers = [user["email"] async for user in server.db.users.find({"_id": {"$regex": "^shopper-"}}, {"email": 1})]
+    if not products or not shoppers:
+        raise SystemExit(f"database {server.db.name!r} is not seeded; run with --seed-only first")
+    return SimpleNamespace(products=products, shoppers=shoppers)
+
+
+# --- Recording ---
+
+class ScenarioError(Exception):
+    pass
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)  # route label -> [ms]
+        self.errors = defaultdict(int)
+        self.iterations = []  # ms per completed scenario iteration
+        self.failed_iterations = 0
+
+    async def call(
+        self, client: httpx.AsyncClient, label: str, method: str, url: str, accept=(), **kwargs
+    ) -> httpx.Response:
+        """Statuses in `accept` are expected outcomes: recorded under "<label> [<status>]", not as errors."""
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.errors[label] += 1
+            raise ScenarioError(f"{label}: {e!r}")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if response.status_code in accept:
+            self.latencies[f"{label} [{response.status_code}]"].append(elapsed_ms)
+            return response
+        self.latencies[label].append(elapsed_ms)
+        if response.status_code >= 400:
+            self.errors[label] += 1
+            raise ScenarioError(f"{label}: HTTP {response.status_code} {response.text[:200]}")
+        return response
+
+
+def percentile(sorted_values, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+def summarize(samples) -> dict:
+    values = sorted(samples)
+    summary = {f"p{p}": round(percentile(values, p), 2) for p in PERCENTILES}
+    summary["max"] = round(values[-1], 2) if values else 0.0
+    summary["count"] = len(values)
+    return summary
+
+
+# --- Scenarios ---
+
+def auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def browse(client, rec, ctx, user):
+    await rec.call(client, "GET /api/landing-page", "GET", "/api/landing-page")
+    await rec.call(client, "GET /api/ticker/", "GET", "/api/ticker/")
+    await rec.call(client, "GET /api/products/featured", "GET", "/api/products/featured")
+    listing = await rec.call(
+        client, "GET /api/products", "GET", "/api/products",
+        params={"page": random.randint(1, 3), "limit": 12, "view": "card"}
+    )
+    products = listing.json()["products"] or ctx.products
+    product = random.choice(products)
+    await rec.call(client, "GET /api/products/{slug_or_id}", "GET", f"/api/products/{product['slug']}")
+    await rec.call(client, "GET /api/reviews/{product_id}", "GET", f"/api/reviews/{product['id']}")
+    await rec.call(client, "GET /api/products/recommendations/{product_id}", "GET", f"/api/products/recommendations/{product['id']}")
+
+
+async def login(client, rec, ctx, user):
+    response = await rec.call(
+        client, "POST /api/auth/login", "POST", "/api/auth/login",
+        json={"email": random.choice(ctx.shoppers), "password": PASSWORD}
+    )
+    token = response.json()["access_token"]
+    await rec.call(client, "GET /api/profile", "GET", "/api/profile", headers=auth(token))
+
+
+async def checkout(client, rec, ctx, user):
+    items = []
+    for product in random.sample(ctx.products, k=random.randint(1, 3)):
+        variant = random.choice(product["variants"])
+        items.append({
+            "product_id": product["id"], "product_name": product["name"], "color": variant["color"],
+            "size": random.choice(list(variant["sizes"])), "quantity": 1, "price": product["price"]
+        })
+    body = {
+        "items": items,
+        "shipping_address": {"name": "Load Test", "phone": "9999999999", "address_line1": "1 MG Road",
+                             "city": "Bengaluru", "state": "KA", "postal_code": "560001"},
+        "total_amount": sum(item["price"] for item in items),
+    }
+    created = (await rec.call(
+        client, "POST /api/orders/create-razorpay-order", "POST", "/api/orders/create-razorpay-order",
+        json=body, headers=auth(user.token)
+    )).json()
+    await rec.call(
+        client, "POST /api/orders/verify-payment", "POST", "/api/orders/verify-payment",
+        json={"razorpay_order_id": created["razorpay_order_id"], "razorpay_payment_id": f"pay_{uuid.uuid4().hex[:14]}",
+              "razorpay_signature": "stub", "order_id": created["order_id"]},
+        headers=auth(user.token)
+    )
+
+
+async def admin(client, rec, ctx, user):
+    headers = auth(ctx.admin_token)
+    await rec.call(client, "GET /api/analytics/dashboard", "GET", "/api/analytics/dashboard", headers=headers)
+    await rec.call(client, "GET /api/orders", "GET", "/api/orders", headers=headers)
+    await rec.call(client, "GET /api/admin/users", "GET", "/api/admin/users", headers=headers)
+    await rec.call(client, "GET /api/analytics/inventory", "GET", "/api/analytics/inventory", headers=headers)
+    await rec.call(client, "GET /api/admin/returns", "GET", "/api/admin/returns", headers=headers)
+
+
+async def storm_login(client, rec, ctx, user):
+    response = await rec.call(
+        client, "POST /api/auth/login", "POST", "/api/auth/login", accept=(429,),
+        json={"email": random.choice(ctx.shoppers), "password": PASSWORD}
+    )
+    if response.status_code == 429:  # back off like a real client would
+        await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+
+
+SCENARIOS = {"browse": browse, "login": login, "checkout": checkout, "admin": admin}
+
+
+# --- Runner ---
+
+async def run_users(client, scenario, ctx, users, seconds: float) -> Recorder:
+    rec = Recorder()
+    deadline = time.perf_counter() + seconds
+
+    async def virtual_user(user):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                await scenario(client, rec, ctx, user)
+            except ScenarioError as e:
+                rec.failed_iterations += 1
+                if rec.failed_iterations <= 3:
+                    print(f"  error: {e}", file=sys.stderr)
+                continue
+            rec.iterations.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(virtual_user(user) for user in users))
+    return rec
+
+
+def scenario_result(rec: Recorder, elapsed: float) -> dict:
+    requests = sum(len(samples) for samples in rec.latencies.values())
+    return {
+        "iterations": len(rec.iterations),
+        "failed_iterations": rec.failed_iterations,
+        "requests": requests,
+        "errors": sum(rec.errors.values()),
+        "requests_per_second": round(requests / elapsed, 1),
+        "iterations_per_second": round(len(rec.iterations) / elapsed, 1),
+        "iteration_ms": summarize(rec.iterations),
+        "routes": {
+            label: {**summarize(samples), "errors": rec.errors.get(label, 0)}
+            for label, samples in sorted(rec.latencies.items())
+        },
+    }
+
+
+async def run_scenario(client, name, ctx, args) -> dict:
+    users = [SimpleNamespace(token=token) for token in ctx.user_tokens[:args.concurrency]]
+    if name == "login-storm":
+        return await run_login_storm(client, ctx, users, args)
+    if args.warmup:
+        await run_users(client, SCENARIOS[name], ctx, users, args.warmup)
+    started = time.perf_counter()
+    rec = await run_users(client, SCENARIOS[name], ctx, users, args.duration)
+    return scenario_result(rec, time.perf_counter() - started)
+
+
+async def run_login_storm(client, ctx, users, args) -> dict:
+    """The browse scenario alone, then the same browsing alongside a login flood."""
+    if args.warmup:
+        await run_users(client, browse, ctx, users, args.warmup)
+    alone = await run_users(client, browse, ctx, users, args.duration)
+
+    stormers = [SimpleNamespace(token=None) for _ in range(args.storm_users)]
+    started = time.perf_counter()
+    during, storm = await asyncio.gather(
+        run_users(client, browse, ctx, users, args.duration),
+        run_users(client, storm_login, ctx, stormers, args.duration),
+    )
+    result = scenario_result(during, time.perf_counter() - started)
+    for label, samples in storm.latencies.items():
+        result["routes"][f"{label} (storm)"] = {**summarize(samples), "errors": storm.errors.get(label, 0)}
+    result["errors"] += sum(storm.errors.values())
+    result["storm"] = {
+        "users": args.storm_users,
+        "logins": len(storm.latencies["POST /api/auth/login"]),
+        "rejected_429": len(storm.latencies["POST /api/auth/login [429]"]),
+        "catalog_alone_ms": summarize(alone.iterations),
+    }
+    return result
+
+
+async def issue_tokens(client, ctx, count: int):
+    ctx.user_tokens = []
+    for i in range(count):
+        response = await client.post("/api/auth/login", json={"email": ctx.shoppers[i % len(ctx.shoppers)], "password": PASSWORD})
+        response.raise_for_status()
+        ctx.user_tokens.append(response.json()["access_token"])
+    response = await client.post("/api/auth/login", json={"email": ADMIN_EMAIL, "password": PASSWORD})
+    response.raise_for_status()
+    ctx.admin_token = response.json()["access_token"]
+
+
+async def run(args) -> dict:
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = args.db
+    os.environ["ADMIN_EMAIL"] = ADMIN_EMAIL
+    # Every virtual user shares one client IP, so the limiter would turn most
+    # logins into 429s and measure itself rather than the app.
+    os.environ["RATE_LIMIT_ENABLED"] = "true" if args.rate_limit else "false"
+    import server
+
+    logging.getLogger("server").setLevel(logging.INFO if args.verbose else logging.ERROR)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if not args.url:
+        await seed(server, args)
+        if args.seed_only:
+            return {}
+    server.razorpay_client = stub_razorpay()
+    ctx = await load_context(server)
+
+    connections = args.concurrency + (args.storm_users if "login-storm" in args.scenarios else 0)
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    uvicorn_server = serve_task = lifespan = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30)
+    elif args.transport == "uvicorn":
+        import uvicorn
+
+        config = uvicorn.Config(server.app, host="127.0.0.1", port=args.port, log_level="warning", access_log=False)
+        uvicorn_server = uvicorn.Server(config)
+        serve_task = asyncio.create_task(uvicorn_server.serve())
+        while not uvicorn_server.started:
+            await asyncio.sleep(0.05)
+        client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=30)
+    else:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://loadtest", timeout=30)
+        lifespan = server.app.router.lifespan_context(server.app)
+        await lifespan.__aenter__()
+
+    results = {}
+    try:
+        async with client:
+            await issue_tokens(client, ctx, args.concurrency)
+            for name in args.scenarios:
+                print(f"running {name} ({args.concurrency} users, {args.duration:g}s)...", file=sys.stderr)
+                results[name] = await run_scenario(client, name, ctx, args)
+    finally:
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+        if uvicorn_server is not None:
+            uvicorn_server.should_exit = True
+            await serve_task
+    return results
+
+
+# --- Reporting ---
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=API_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def storm_slowdown(result: dict) -> float:
+    alone_p95 = result["storm"]["catalog_alone_ms"]["p95"]
+    return result["iteration_ms"]["p95"] / alone_p95 - 1 if alone_p95 else 0.0
+
+
+def print_report(results: dict, baseline: dict = None):
+    header = f"{'scenario / route':<52}{'count':>8}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}{'err':>6}"
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        it = result["iteration_ms"]
+        line = (
+            f"{name + ' (iteration)':<52}{it['count']:>8}{it['p50']:>9.1f}{it['p90']:>9.1f}"
+            f"{it['p95']:>9.1f}{it['p99']:>9.1f}{it['max']:>9.1f}{result['failed_iterations']:>6}"
+        )
+        print(line)
+        for label, route in result["routes"].items():
+            print(
+                f"  {label:<50}{route['count']:>8}{route['p50']:>9.1f}{route['p90']:>9.1f}"
+                f"{route['p95']:>9.1f}{route['p99']:>9.1f}{route['max']:>9.1f}{route['errors']:>6}"
+            )
+        print(f"  -> {result['requests_per_second']} req/s, {result['iterations_per_second']} iterations/s")
+        if "storm" in result:
+            storm, alone = result["storm"], result["storm"]["catalog_alone_ms"]
+            print(
+                f"  -> {storm['users']} storm users: {storm['logins']} logins, {storm['rejected_429']} shed with 429; "
+                f"browse iteration p50/p95 {alone['p50']:.1f}/{alone['p95']:.1f} ms alone, "
+                f"{it['p50']:.1f}/{it['p95']:.1f} ms during the storm ({storm_slowdown(result):+.1%} p95)"
+            )
+        previous = (baseline or {}).get("scenarios", {}).get(name)
+        if previous:
+            rps_delta = result["requests_per_second"] / previous["requests_per_second"] - 1 if previous["requests_per_second"] else 0
+            p95_delta = it["p95"] / previous["iteration_ms"]["p95"] - 1 if previous["iteration_ms"]["p95"] else 0
+            print(f"  vs baseline: throughput {rps_delta:+.1%}, iteration p95 {p95_delta:+.1%}")
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=[*SCENARIOS, "login-storm"])
+    parser.add_argument("--transport", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--url", help="drive a running server instead (no seeding, no checkout)")
+    parser.add_argument("--seed-only", action="store_true", help="seed --db and exit, for a later --url run")
+    parser.add_argument("--port", type=int, default=8765, help="uvicorn transport only")
+    parser.add_argument("--concurrency", type=int, default=20, help="virtual users per scenario")
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds before each scenario")
+    parser.add_argument("--storm-users", type=int, default=50, help="login-storm: clients posting logins back to back")
+    parser.add_argument(
+        "--storm-max-slowdown", type=float,
+        help="login-storm: exit 1 if browse p95 during the storm is more than this fraction above p95 alone"
+    )
+    parser.add_argument("--mongo-url", default=os.environ.get("LOADTEST_MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="fifth_beryl_loadtest", help="scratch database, dropped on every run")
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42, help="random seed for data and scenario choices")
+    parser.add_argument("--save", help="write results as a JSON baseline to this file")
+    parser.add_argument("--compare", help="print deltas against a baseline written by --save")
+    parser.add_argument("--verbose", action="store_true", help="keep the server's INFO logging")
+    parser.add_argument("--rate-limit", action="store_true", help="keep the server's rate limiter on (in-process runs)")
+    args = parser.parse_args()
+    if args.scenarios is None:
+        args.scenarios = [name for name in SCENARIOS if not (args.url and name == "checkout")]
+    if args.url and "checkout" in args.scenarios:
+        parser.error("checkout needs the in-process Razorpay stub and cannot run against --url")
+
+    random.seed(args.seed)
+    results = asyncio.run(run(args))
+    if args.seed_only:
+        print(f"seeded {args.db}", file=sys.stderr)
+        return
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(results, baseline)
+
+    if args.save:
+        document = {
+            "meta": {
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "git_commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                **{key: getattr(args, key) for key in ("transport", "url", "concurrency", "duration", "warmup", "storm_users", "products", "users", "orders", "seed")},
+            },
+            "scenarios": results,
+        }
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save).write_text(json.dumps(document, indent=2))
+        print(f"baseline written to {args.save}", file=sys.stderr)
+
+    storm = results.get("login-storm")
+    if storm and args.storm_max_slowdown is not None and storm_slowdown(storm) > args.storm_max_slowdown:
+        print(f"FAIL: browse p95 rose {storm_slowdown(storm):+.1%} during the login storm "
+              f"(allowed {args.storm_max_slowdown:+.0%})", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# backend/serve.py
+"""
+Production entrypoint for the API: gunicorn managing uvicorn workers that run
+on uvloop with the httptools parser.
+
+    python serve.py                          # 0.0.0.0:8000, one worker per CPU
+    PORT=8080 WEB_CONCURRENCY=4 python serve.py
+    gunicorn -c serve.py                     # same settings via the gunicorn CLI
+
+Every setting comes from the environment (defaults in brackets):
+
+  HOST [0.0.0.0], PORT [8000]
+  WEB_CONCURRENCY             workers [usable CPUs, see available_cpus()]
+  KEEPALIVE_SECONDS [65]      idle keep-alive; keep above the load balancer's
+                              idle timeout (60 s on AWS ALB) so the proxy, not
+                              the app, closes idle connections
+  BACKLOG [2048]              listen() queue for connection bursts
+  MAX_REQUESTS [10000]        recycle a worker after this many requests to cap
+  MAX_REQUESTS_JITTER [1000]  memory growth; jitter staggers the restarts
+  GRACEFUL_TIMEOUT [30]       seconds a worker may spend draining on SIGTERM
+  WORKER_TIMEOUT [60]         kill a worker whose event loop stops heartbeating
+  FORWARDED_ALLOW_IPS [127.0.0.1]
+                              proxies whose X-Forwarded-For/-Proto are trusted;
+                              set it to the load balancer's address (or "*" if
+                              only the balancer can reach the app), otherwise
+                              every client has the proxy's IP and shares its
+                              per-IP rate limits
+
+On SIGTERM the arbiter stops accepting connections and each worker finishes
+its in-flight requests (closing idle keep-alive connections) for up to
+GRACEFUL_TIMEOUT seconds before exiting. Recycled workers drain the same way.
+"""
+import math
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from uvicorn.workers import UvicornWorker
+
+BACKEND_DIR = Path(__file__).resolve().parent
+API_DIR = BACKEND_DIR / "api"
+
+
+def available_cpus() -> int:
+    """CPUs this process may actually use: affinity mask, capped by a cgroup v2 CPU quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS / Windows
+        cpus = os.cpu_count() or 1
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+class ProductionUvicornWorker(UvicornWorker):
+    # Fail loudly instead of silently falling back to asyncio/h11 ("auto").
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Without this uvicorn waits for in-flight requests indefinitely and
+        # gunicorn SIGKILLs the worker after graceful_timeout, dropping them.
+        self.config.timeout_graceful_shutdown = max(1, int(self.cfg.graceful_timeout) - 1)
+
+
+# --- gunicorn settings (read by `gunicorn -c serve.py` and by main()) ---
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY') or available_cpus())
+worker_class = "serve.ProductionUvicornWorker"
+pythonpath = f"{API_DIR},{BACKEND_DIR}"  # server.py, and this module for worker_class
+wsgi_app = "server:app"
+keepalive = int(os.environ.get('KEEPALIVE_SECONDS', '65'))
+backlog = int(os.environ.get('BACKLOG', '2048'))
+max_requests = int(os.environ.get('MAX_REQUESTS', '10000'))
+max_requests_jitter = int(os.environ.get('MAX_REQUESTS_JITTER', '1000'))
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', '30'))
+timeout = int(os.environ.get('WORKER_TIMEOUT', '60'))
+preload_app = False  # each worker imports server and opens its own Mongo pool after fork
+accesslog = os.environ.get('ACCESS_LOG') or None  # "-" for stdout; off by default
+forwarded_allow_ips = os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1')  # UvicornWorker passes it to uvicorn
+
+
+def on_starting(server):
+    # /metrics aggregates all workers through prometheus-client's multiprocess mode.
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="fifth-beryl-metrics-"))
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def main():
+    from gunicorn.app.base import BaseApplication
+
+    settings = {name: value for name, value in globals().items() if name in {
+        "bind", "workers", "worker_class", "pythonpath", "wsgi_app", "keepalive", "backlog", "max_requests",
+        "max_requests_jitter", "graceful_timeout", "timeout", "preload_app", "accesslog", "forwarded_allow_ips",
+        "on_starting", "child_exit",
+    }}
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for name, value in settings.items():
+                self.cfg.set(name, value)
+
+        def load(self):
+            from server import app
+            return app
+
+    sys.path[:0] = pythonpath.split(",")  # BaseApplication, unlike the gunicorn CLI, ignores pythonpath
+    Application().run()
+
+
+if __name__ == "__main__":
+    main()
@@ -30,6 +30,10 @@ const ProductsPage = () => {
     const timerId = setTimeout(() => {
       setDebouncedSearchTerm(searchTerm);
       setCurrentPage(1); 
+      // "Relevance" is only offered while searching; fall back to the default sort
+      if (!searchTerm) {
+        setSortBy((current) => (current === 'relevance' ? 'name' : current));
+      }
     }, 500);
     return () => clearTimeout(timerId);
   }, [searchTerm]);
@@ -164,6 +168,7 @@ const ProductsPage = () => {
                 <SelectValue placeholder="Sort Order" />
               </SelectTrigger>
               <SelectContent>
+                {debouncedSearchTerm && <SelectItem value="relevance">Relevance</SelectItem>}
                 <SelectItem value="name">Name (A-Z)</SelectItem>
                 <SelectItem value="price-low">Price (Low to High)</SelectItem>
                 <SelectItem value="price-high">Price (High to Low)</SelectItem>